@@ -1,3 +1,4 @@
 from .auth.router import router as AuthRouter  # noqa
 from .image.router import router as ImageRouter  # noqa
+from .metrics.router import router as MetricsRouter  # noqa
 from .tags.router import router as TagRouter  # noqa
@@ -3,9 +3,9 @@ from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 
-from dependencies import (auth_guard, create_auth_response, get_http, get_pg,
-                          get_redis)
-from libs import AuthException, Crypt, initialize_model, validate_google_user
+from dependencies import (auth_guard, create_auth_response, crypt, get_http,
+                          get_pg, get_redis, verify_password)
+from libs import AuthException, initialize_model, validate_google_user
 from model.auth import (AuthenticatedUser, FBLoginData, GoogleLoginData,
                         SimpleUserCredential)
 from model.http import AuthResponse
@@ -25,7 +25,8 @@ async def sign_up_with_username_password(
     if not cred:
         raise AuthException.INVALID_CREDENTIAL
 
-    user = await pg.save_user(cred.email, Crypt.hash(cred.password))
+    hashed_pwd = await crypt.hash(cred.password)
+    user = await pg.save_user(cred.email, hashed_pwd)
 
     if not user:
         raise AuthException.DUPLICATE_USER
@@ -41,12 +42,7 @@ async def login_with_username_password(
     email, pwd = form_data.username, form_data.password
     user = await pg.get_user(email=email)
 
-    if not user:
-        raise AuthException.INVALID_EMAIL_PWD
-
-    valid_pwd = Crypt.verify(pwd, user.password)
-
-    if not valid_pwd:
+    if not user or not await verify_password(pg, user, pwd):
         raise AuthException.INVALID_EMAIL_PWD
 
     return create_auth_response(user)
@@ -71,7 +67,7 @@ async def auth_with_google(
     payload: GoogleLoginData,
     pg: Postgres = Depends(get_pg),
 ):
-    valid = validate_google_user(payload.id_token, payload.email)
+    valid = await validate_google_user(payload.id_token, payload.email)
 
     if not valid:
         raise AuthException.FAIL_GOOGLE_AUTH
@@ -109,5 +105,5 @@ async def invalidate_token_and_logout(
     now = datetime.now(timezone.utc).timestamp()
     exp = user.exp.timestamp()
     delta = timedelta(seconds=exp - now)
-    await rd.invalidate_token(user.token, ttl=delta)
+    await rd.invalidate_token(user.token_id, ttl=delta)
     return "OK"
@@ -1,46 +1,73 @@
-from datetime import datetime, timedelta
-from urllib.parse import urlencode
+from datetime import datetime
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, Form, UploadFile
+from fastapi import APIRouter, Depends, File, Request, UploadFile
+from pydantic import ValidationError
 
-from dependencies import auth_guard, get_minio, get_pg
-from libs import (ImageException, fix_tags, make_storage_key,
-                  validate_image_file)
+from dependencies import (auth_guard, find_image, get_minio, get_pg, get_redis,
+                          receive_upload, save_upload, search_images)
+from libs import ImageException, decode_cursor, fix_tags, next_page_query
 from model.auth import AuthenticatedUser
-from model.http import (QueryImageResponse, SearchImagesResponse,
+from model.enums import SearchMode
+from model.http import (UPLOAD_IMAGE_BODY, BulkImportResponse,
+                        FindImagesByIdsRequest, FindImagesByIdsResponse,
+                        QueryImageResponse, SearchImagesResponse,
                         UploadImageResponse)
-from repository import Minio, Postgres
+from repository import Minio, Postgres, Redis
 
 router = APIRouter()
 
 
-@router.post("", response_model=UploadImageResponse)
+@router.post("", response_model=UploadImageResponse, openapi_extra=UPLOAD_IMAGE_BODY)
 async def upload_image(
+    request: Request,
     user: AuthenticatedUser = Depends(auth_guard),
-    image: UploadFile = File(...),
-    tags: str = Form(None),
     minio: Minio = Depends(get_minio),
     pg: Postgres = Depends(get_pg),
+    rd: Redis = Depends(get_redis),
 ):
     """
-    - Maximum file size guard shall be handled by web-server ie  nginx or traefik
+    - FormData[image, tags], `tags` being comma-separated
+    - The image is streamed to storage while received: non-images are rejected
+    from their first bytes, uploads larger than UPLOAD_MAX_SIZE are aborted
+    - With CONTENT_ADDRESSED_STORAGE, images of the same content share one stored object.
+    Sending the image's `sha256` before it skips storing an already known content
     """
-    valid = validate_image_file(image.filename)
+    image, tags = await receive_upload(request, minio, pg)
+    fixed_tags = fix_tags(tags)
 
-    if not valid:
-        raise ImageException.IMAGE_ONLY
+    tagged_image = await save_upload(pg, minio, image, user.user_id, fixed_tags)
+    await rd.bump_tag_versions(tagged_image.tag_names)
 
-    storage_key = make_storage_key(image.filename)
-    minio.save_image(storage_key, image.file)
+    return UploadImageResponse(
+        **tagged_image.image.dict(), tags=fixed_tags, sha256=image.stream.sha256
+    )
 
-    fixed_tags = fix_tags(tags)
 
-    tagged_image = await pg.save_tagged_image(
-        image.filename, storage_key, user.user_id, fixed_tags
-    )
+@router.post("/bulk", response_model=BulkImportResponse)
+async def bulk_import_images(
+    user: AuthenticatedUser = Depends(auth_guard),
+    manifest: UploadFile = File(...),
+    minio: Minio = Depends(get_minio),
+    pg: Postgres = Depends(get_pg),
+    rd: Redis = Depends(get_redis),
+):
+    """
+    - Manifest holds one JSON image per line: name, storage_key, tags, created_at
+    - The whole manifest is validated first, nothing is imported from an invalid one
+    - Images must already be in storage: storage_keys missing from storage
+    or already known are skipped
+    """
+    try:
+        imported, total = await pg.import_manifest(
+            manifest.file, uploader=user.user_id, stored=minio.stored_images
+        )
+    except ValidationError:
+        raise ImageException.INVALID_MANIFEST
 
-    return UploadImageResponse(**tagged_image.image.dict(), tags=fixed_tags)
+    # Rare enough that invalidating searches even on a no-op import is fine
+    await rd.bump_tag_versions()
+    return BulkImportResponse(imported=imported, total=total)
 
 
 @router.get("/find_one", response_model=QueryImageResponse)
@@ -49,64 +76,92 @@ async def find_one_image(
     user: AuthenticatedUser = Depends(auth_guard),
     minio: Minio = Depends(get_minio),
     pg: Postgres = Depends(get_pg),
+    rd: Redis = Depends(get_redis),
 ):
-    image = await pg.get_image(id)
+    image = await find_image(pg, rd, id, user_id=user.user_id)
 
     if not image:
         raise ImageException.IMAGE_NOT_FOUND
 
     url = minio.get_image(image.image.storage_key)
-    return QueryImageResponse(**image.image.dict(), tags=image.tag_names, url=url)
+    return QueryImageResponse.from_tagged_image(image, url)
+
+
+@router.post("/find_by_ids", response_model=FindImagesByIdsResponse)
+async def find_images_by_ids(
+    body: FindImagesByIdsRequest,
+    user: AuthenticatedUser = Depends(auth_guard),
+    minio: Minio = Depends(get_minio),
+    pg: Postgres = Depends(get_pg),
+):
+    """
+    - Up to 500 ids, found images are returned in the order of the ids
+    - Ids of unknown images are listed in `missing`
+    """
+    ids = list(dict.fromkeys(body.ids))
+    images = {i.image.id: i for i in await pg.get_images(ids, user_id=user.user_id)}
+
+    found = [images[id] for id in ids if id in images]
+    urls = minio.get_images([i.image.storage_key for i in found])
+    data = [QueryImageResponse.from_tagged_image(i, url) for i, url in zip(found, urls)]
+
+    missing = [id for id in ids if id not in images]
+    return FindImagesByIdsResponse(data=data, missing=missing)
 
 
 @router.get("/find_many", response_model=SearchImagesResponse)
 async def find_images(
     tags: str,
     limit: int = 5,
-    from_date: datetime = datetime.fromtimestamp(0),
-    to_date: datetime = datetime.now() + timedelta(minutes=1),
-    prev_id: UUID = None,
+    from_date: datetime = None,
+    to_date: datetime = None,
+    cursor: str = None,
+    mode: SearchMode = "any",
     user: AuthenticatedUser = Depends(auth_guard),
     minio: Minio = Depends(get_minio),
     pg: Postgres = Depends(get_pg),
+    rd: Redis = Depends(get_redis),
 ):
+    """
+    - `mode=all` finds images having every tag, `mode=any` at least one of them
+    - `next` holds the query for the following page, its `cursor` is opaque
+    """
     fixed_tags = fix_tags(tags)
 
     if not fixed_tags:
         return []
 
-    images = await pg.search_image_by_tags(
+    position = decode_cursor(cursor) if cursor else (to_date, None)
+
+    if not position:
+        raise ImageException.INVALID_CURSOR
+
+    to_date, prev_id = position
+    images = await search_images(
+        pg,
+        rd,
         fixed_tags,
         limit + 1,
         from_date=from_date,
         to_date=to_date,
         previous_id=prev_id,
+        mode=mode,
     )
 
     has_next = len(images) == limit + 1
     images = images[:-1] if has_next else images
 
-    data = []
-
-    for i in images:
-        img_tags = i.tag_names
-        img_info = i.image.dict()
-        url = minio.get_image(i.image.storage_key)
-        image = QueryImageResponse(**img_info, tags=img_tags, url=url)
-        data.append(image)
+    urls = minio.get_images([i.image.storage_key for i in images])
+    data = [QueryImageResponse.from_tagged_image(i, url) for i, url in zip(images, urls)]
 
-    if not has_next:
-        return SearchImagesResponse(data=data)
-
-    to_date, prev_id = data[-1].created_at, data[-1].id
-
-    next_params = {
-        "tags": ",".join(fixed_tags),
-        "limit": limit,
-        "from_date": from_date,
-        "to_date": to_date,
-        "prev_id": prev_id,
-    }
+    last = data[-1] if has_next else None
+    next_link = next_page_query(
+        last.created_at,
+        last.id,
+        tags=",".join(fixed_tags),
+        limit=limit,
+        mode=mode,
+        from_date=from_date,
+    ) if last else ""
 
-    next_link = urlencode(next_params)
     return SearchImagesResponse(data=data, next=next_link)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends
+
+from dependencies import (auth_guard, claims_cache, get_mc, get_minio, get_pg,
+                          image_cache)
+from model.auth import AuthenticatedUser
+from model.http import MetricsResponse
+from repository import MetricCollector, Minio, Postgres
+
+router = APIRouter()
+
+
+@router.get("", response_model=MetricsResponse)
+async def get_metrics(
+    _: AuthenticatedUser = Depends(auth_guard),
+    pg: Postgres = Depends(get_pg),
+    minio: Minio = Depends(get_minio),
+    mc: MetricCollector = Depends(get_mc),
+):
+    """
+    - Per-statement calls, errors, rows & latency histogram, slow queries
+      (their plans are only logged)
+    - Hit/miss counters of the in-process caches
+    """
+    caches = {
+        "jwt_claims": claims_cache.stats(),
+        "tags": pg.tags.stats(),
+        "images": image_cache.stats(),
+        "presigned_urls": minio.url_cache_stats(),
+    }
+    return MetricsResponse(**pg.q.metrics(), caches=caches, tracking=mc.stats())
@@ -0,0 +1,36 @@
+"""Bulk-import images from a manifest file, one JSON image per line:
+{"name": "cat.png", "storage_key": "<key in bucket>", "tags": ["cat"], "created_at": null}
+Images must already be in storage, the others are skipped
+
+$ pipenv run bulk-import manifest.jsonl --batch-size 20000
+"""
+import asyncio
+from argparse import ArgumentParser
+
+from logzero import logger as log
+
+from repository.minio import Minio
+from repository.postgres import Postgres
+from settings import settings
+
+
+async def bulk_import(path: str, batch_size: int, uploader: int = None):
+    pg = await Postgres.init(settings)
+    minio = Minio.init(settings)
+
+    with open(path, "rb") as manifest:
+        imported, total = await pg.import_manifest(
+            manifest, uploader, batch_size, stored=minio.stored_images
+        )
+
+    log.info("Done: %s images imported, %s skipped", imported, total - imported)
+    await pg.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Bulk-import images from a manifest")
+    parser.add_argument("manifest", help="path to the manifest file")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--uploader", type=int, default=None, help="uploader's user id")
+    args = parser.parse_args()
+    asyncio.run(bulk_import(args.manifest, args.batch_size, args.uploader))
@@ -0,0 +1,26 @@
+"""Create monthly partitions of the tagged table ahead of time, safe to re-run.
+Meant to be scheduled, ie daily with cron:
+
+$ pipenv run create-partitions --months-ahead 3
+"""
+import asyncio
+from argparse import ArgumentParser
+
+from logzero import logger as log
+
+from repository.postgres import Postgres
+from settings import settings
+
+
+async def create_partitions(months_ahead: int):
+    pg = await Postgres.init(settings)
+    created = await pg.create_partitions(months_ahead)
+    log.info("Created %s new partitions of tagged", created)
+    await pg.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Create upcoming partitions of tagged")
+    parser.add_argument("--months-ahead", type=int, default=settings.PG_PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+    asyncio.run(create_partitions(args.months_ahead))
@@ -0,0 +1,47 @@
+"""Delete stored objects no image refers to anymore, once past a grace period.
+Meant to be scheduled, ie hourly with cron:
+
+$ pipenv run gc-objects --grace-hours 24
+"""
+import asyncio
+from argparse import ArgumentParser
+from datetime import timedelta
+from functools import partial
+from typing import List
+
+from logzero import logger as log
+
+from repository.minio import Minio
+from repository.postgres import Postgres
+from settings import settings
+
+
+async def delete_stored(minio: Minio, keys: List[str]) -> List[str]:
+    failed = await minio.delete_images(keys)
+
+    if failed:
+        log.warning("Could not delete from storage, kept for next run: %s", ", ".join(failed))
+
+    return failed
+
+
+async def gc_objects(grace_hours: int, batch_size: int):
+    pg = await Postgres.init(settings)
+    minio = Minio.init(settings)
+    grace, delete = timedelta(hours=grace_hours), partial(delete_stored, minio)
+    deleted = 0
+
+    # Stops at the first batch storage deletes nothing of
+    while batch := await pg.delete_orphaned_objects(grace, delete, batch_size):
+        deleted += len(batch)
+
+    log.info("Deleted %s orphaned objects", deleted)
+    await pg.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Delete orphaned stored objects")
+    parser.add_argument("--grace-hours", type=int, default=settings.OBJECT_GC_GRACE_HOURS)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(gc_objects(args.grace_hours, args.batch_size))
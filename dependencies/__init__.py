@@ -1,2 +1,5 @@
 from .auth import *  # noqa
+from .cache import *  # noqa
 from .get_repos import *  # noqa
+from .negotiate import *  # noqa
+from .upload import *  # noqa
@@ -1,42 +1,66 @@
+from hashlib import blake2b
 from typing import Union
 
 from fastapi import Depends, Request
 from fastapi.exceptions import HTTPException
 from fastapi.security import OAuth2PasswordBearer
 
-from libs import Jwt
+from libs import Crypt, Jwt, LRUCache
 from model.auth import AuthenticatedUser
 from model.http import AuthResponse
 from model.postgres import User
-from repository import MetricCollector, Redis
+from repository import MetricCollector, Postgres, Redis
 from settings import settings
 
 from .get_repos import get_mc, get_redis
 
 jwt = Jwt(settings)
+crypt = Crypt(settings)
+claims_cache = LRUCache(settings.JWT_CACHE_SIZE)
 scheme = OAuth2PasswordBearer(tokenUrl="/v1/auth/login")
 
 
-async def check_token_validity(
-    token: str = Depends(scheme),
-    rd: Redis = Depends(get_redis),
-):
-    invalid = await rd.is_token_invalid(token)
-    if invalid:
+async def jwt_guard(token: str = Depends(scheme)):
+    """Verified users are cached by token digest until the token expires,
+    so repeated requests with the same token skip verification & model building.
+    Async, so that it runs on the event-loop: the cache is not thread-safe
+    """
+    global jwt
+    key = blake2b(token.encode(), digest_size=16).digest()
+    user = claims_cache.get(key)
+
+    if user:
+        return user
+
+    claim = jwt.decode(token)
+
+    if not claim:
         raise HTTPException(401)
 
-    return token
+    user = AuthenticatedUser(**claim, token=token)
+    claims_cache.set(key, user, expire_at=user.exp.timestamp())
+    return user
 
 
-def jwt_guard(token: str = Depends(scheme)):
-    global jwt
+async def verify_password(pg: Postgres, user: User, password: str) -> bool:
+    """Hashes made with outdated parameters are upgraded on a successful login"""
+    valid, new_hash = await crypt.verify_and_update(password, user.password)
 
-    claim = jwt.decode(token)
+    if new_hash:
+        await pg.update_user_password(user.id, new_hash)
 
-    if not claim:
+    return valid
+
+
+async def check_token_validity(
+    user: AuthenticatedUser = Depends(jwt_guard),
+    rd: Redis = Depends(get_redis),
+):
+    invalid = await rd.is_token_invalid(user.token_id)
+    if invalid:
         raise HTTPException(401)
 
-    return AuthenticatedUser(**claim, token=token)
+    return user.token
 
 
 async def user_tracking(
@@ -44,7 +68,7 @@ async def user_tracking(
     user: AuthenticatedUser = Depends(jwt_guard),
     mc: MetricCollector = Depends(get_mc),
 ):
-    await mc.collect_user(user, str(request.url))
+    mc.track_user(user, str(request.url))
     return user
 
 
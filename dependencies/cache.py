@@ -0,0 +1,69 @@
+from datetime import datetime
+from hashlib import blake2b
+from time import time
+from typing import List, Optional
+from uuid import UUID
+
+import orjson
+
+from libs import LRUCache
+from model.postgres import Image, Tag, TaggedImage
+from repository import Postgres, Redis
+from settings import settings
+
+image_cache = LRUCache(settings.IMAGE_CACHE_SIZE)
+_missing = object()
+
+
+def from_cached(row: dict) -> TaggedImage:
+    """Cached rows were validated when first read, they are rebuilt without validation"""
+    image = {**row["image"], "id": UUID(row["image"]["id"])}
+    image["created_at"] = datetime.fromisoformat(image["created_at"])
+    tags = [Tag.construct(**t) for t in row["tags"]]
+    return TaggedImage.construct(image=Image.construct(**image), tags=tags)
+
+
+async def search_images(
+    pg: Postgres, rd: Redis, tags: List[str], limit: int, **params
+) -> List[TaggedImage]:
+    """Search results are cached under the current versions of their tags,
+    an upload bumps the versions of its tags so no outdated page is served.
+    A replica lagging behind a bump would get its outdated page cached under the new
+    versions: misses of recently bumped tags are computed on the primary
+    """
+    tags = sorted(tags)
+    versions = await rd.tag_versions(tags)
+    key = orjson.dumps([tags, versions, limit, params], option=orjson.OPT_SORT_KEYS)
+
+    async def compute() -> str:
+        primary = await rd.bumped_recently(tags)
+        images = await pg.search_image_by_tags(tags, limit, primary=primary, **params)
+        return orjson.dumps([i.dict() for i in images]).decode()
+
+    digest = blake2b(key, digest_size=16).hexdigest()
+    found = await rd.get_or_compute(f"search___{digest}", compute, settings.SEARCH_CACHE_TTL)
+    return [from_cached(row) for row in orjson.loads(found)]
+
+
+async def find_image(
+    pg: Postgres, rd: Redis, image_id: UUID, user_id: int = None
+) -> Optional[TaggedImage]:
+    """Images & their tags don't change after upload: read through an in-process LRU,
+    then Redis, then Postgres. Unknown ids are cached briefly, absorbing scans of random ids
+    """
+    key = f"image___{image_id}"
+    image = image_cache.get(key, _missing)
+
+    if image is not _missing:
+        return image
+
+    async def compute() -> str:
+        found = await pg.get_image(image_id, user_id=user_id)
+        return orjson.dumps(found.dict() if found else None).decode()
+
+    args = (settings.IMAGE_CACHE_TTL, settings.IMAGE_MISS_TTL)
+    row = orjson.loads(await rd.get_or_compute(key, compute, *args))
+    image = from_cached(row) if row else None
+    ttl = settings.IMAGE_CACHE_LOCAL_TTL if image else settings.IMAGE_MISS_TTL
+    image_cache.set(key, image, expire_at=time() + ttl)
+    return image
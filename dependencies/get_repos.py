@@ -20,6 +20,7 @@ async def get_pg():
 
     if not pg:
         pg = await Postgres.init(st)
+        await pg.create_partitions(st.PG_PARTITION_MONTHS_AHEAD)
 
     yield pg
 
@@ -44,10 +45,12 @@ async def get_mc():
     if st.STAGE == "test":
         test_mc = await MetricCollector.init(st)
         yield test_mc
+        await test_mc.flush()
         return
 
     if not mc:
         mc = await MetricCollector.init(st)
+        mc.start()
 
     yield mc
 
@@ -62,6 +65,7 @@ async def get_redis():
 
     if not rd:
         rd = await Redis.init(st)
+        rd.start_revocation_sync()
 
     yield rd
 
@@ -69,3 +73,10 @@ async def get_redis():
 async def get_http():
     http = Http()
     yield http
+
+
+async def close_repos():
+    """Release resources on app shutdown, flush pending metrics"""
+    for repo in (mc, pg, rd):
+        if repo:
+            await repo.close()
@@ -0,0 +1,9 @@
+from fastapi import Request
+
+from libs.responses import JSON, MSGPACK, accepted_media_type
+
+
+async def negotiate_media_type(request: Request):
+    """Remember what the client accepts so FastResponse renders it in this request context"""
+    accept = request.headers.get("accept", "")
+    accepted_media_type.set(MSGPACK if MSGPACK in accept else JSON)
@@ -0,0 +1,136 @@
+from typing import List, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+
+from libs import (FormPart, ImageException, ImageStream, iter_form_parts,
+                  make_storage_key, validate_image_file)
+from model.postgres import TaggedImage
+from repository import Minio, Postgres
+from settings import settings
+
+
+class StoredImage(NamedTuple):
+    filename: str
+    storage_key: str
+    stream: ImageStream
+    written: bool
+
+
+async def store_image(part: FormPart, minio: Minio, existing_key: str = None) -> StoredImage:
+    """Stream the image part to storage, checked on the way.
+    Content already stored under `existing_key` is only checked, not written again
+    """
+    if not part.filename or not validate_image_file(part.filename):
+        raise ImageException.IMAGE_ONLY
+
+    stream = ImageStream(part.chunks(), settings.UPLOAD_MAX_SIZE)
+    content_type = await stream.sniff()
+
+    if existing_key:
+        await stream.consume()
+        return StoredImage(part.filename, existing_key, stream, written=False)
+
+    storage_key = make_storage_key(part.filename)
+    await minio.save_image(storage_key, stream.chunks(), content_type)
+    return StoredImage(part.filename, storage_key, stream, written=True)
+
+
+async def discard_image(minio: Minio, image: StoredImage, kept_key: str = None):
+    """Delete the image this upload wrote to storage, unless it is the object kept"""
+    if image.written and image.storage_key != kept_key:
+        await minio.delete_images([image.storage_key])
+
+
+async def find_declared_object(part: FormPart, pg: Postgres) -> Tuple[str, Optional[str]]:
+    """With content-addressed storage, a `sha256` field sent before the image
+    lets an already stored content skip the upload to storage
+    """
+    declared = (await part.read(settings.UPLOAD_MAX_FIELD_SIZE)).decode().strip().lower()
+    existing_key = await pg.find_object(declared) if settings.CONTENT_ADDRESSED_STORAGE else None
+    return declared, existing_key
+
+
+class UploadForm:
+    """Fields of an upload form, handled one by one as they arrive"""
+
+    def __init__(self, minio: Minio, pg: Postgres):
+        self.minio = minio
+        self.pg = pg
+        self.image: Optional[StoredImage] = None
+        self.tags = ""
+        self.declared: Optional[str] = None
+        self.existing_key: Optional[str] = None
+
+    async def _on_image(self, part: FormPart):
+        if self.image:
+            raise ImageException.SINGLE_IMAGE
+
+        self.image = await store_image(part, self.minio, self.existing_key)
+
+    async def _on_tags(self, part: FormPart):
+        self.tags = (await part.read(settings.UPLOAD_MAX_FIELD_SIZE)).decode()
+
+    async def _on_sha256(self, part: FormPart):
+        self.declared, self.existing_key = await find_declared_object(part, self.pg)
+
+    async def receive(self, part: FormPart):
+        """Unknown fields are skipped"""
+        handlers = {"image": self._on_image, "tags": self._on_tags, "sha256": self._on_sha256}
+        handler = handlers.get(part.name)
+
+        if handler:
+            await handler(part)
+
+    def _checked_image(self) -> StoredImage:
+        if not self.image:
+            raise ImageException.IMAGE_ONLY
+
+        if self.declared and self.declared != self.image.stream.sha256:
+            raise ImageException.HASH_MISMATCH
+
+        return self.image
+
+    async def read(self, request: Request) -> Tuple[StoredImage, str]:
+        async for part in iter_form_parts(request, settings.UPLOAD_MAX_FIELD_SIZE):
+            await self.receive(part)
+
+        return self._checked_image(), self.tags
+
+    async def discard(self):
+        if self.image:
+            await discard_image(self.minio, self.image)
+
+
+async def receive_upload(
+    request: Request, minio: Minio, pg: Postgres
+) -> Tuple[StoredImage, str]:
+    """Read the `image`, `tags` & optional `sha256` fields of an upload form in one pass,
+    the image goes straight to storage while it is being received.
+    A rejected form leaves nothing in storage
+    """
+    form = UploadForm(minio, pg)
+
+    try:
+        return await form.read(request)
+    except BaseException:
+        await form.discard()
+        raise
+
+
+async def save_upload(
+    pg: Postgres, minio: Minio, image: StoredImage, uploader: Optional[int], tags: List[str]
+) -> TaggedImage:
+    """Save the image received, storage stays in line with it: the object written is deleted
+    when the save fails, or when the same content was already stored (content-addressed)
+    """
+    content_hash = image.stream.sha256 if settings.CONTENT_ADDRESSED_STORAGE else None
+    args = (image.filename, image.storage_key, uploader, tags)
+
+    try:
+        tagged_image = await pg.save_tagged_image(*args, content_hash=content_hash)
+    except BaseException:
+        await discard_image(minio, image)
+        raise
+
+    await discard_image(minio, image, kept_key=tagged_image.image.storage_key)
+    return tagged_image
@@ -1,4 +1,7 @@
+from .cache import LRUCache  # noqa
 from .crypt import Crypt  # noqa
 from .exceptions import *  # noqa
 from .jwt import Jwt  # noqa
+from .responses import FastResponse  # noqa
+from .upload import FormPart, ImageStream, iter_form_parts  # noqa
 from .utils import *  # noqa
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from time import time
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """Bounded in-process LRU cache
+    Entries expire after `ttl` seconds, or at an explicit `expire_at` timestamp
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None) -> Any:
+        value, expire_at = self._data.get(key, (None, None))
+
+        if expire_at is None or expire_at <= time():
+            self.misses += 1
+            self._data.pop(key, None)
+            return default
+
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, expire_at: Optional[float] = None):
+        expire_at = expire_at or time() + (self.ttl or float("inf"))
+        self._data[key] = (value, expire_at)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
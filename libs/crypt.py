@@ -1,7 +1,56 @@
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
 from passlib.context import CryptContext
 
-Crypt = CryptContext(
-    schemes=["pbkdf2_sha256"],
-    default="pbkdf2_sha256",
-    pbkdf2_sha256__default_rounds=30000,
-)
+from settings import Settings
+
+from .exceptions import AuthException
+
+
+class Crypt:
+    """Password hashing is CPU-bound by design, run it on a bounded thread-pool
+    (hashlib releases the GIL) so that a burst of logins cannot freeze the event-loop.
+    Requests beyond the worker & queue capacity are rejected right away
+    """
+
+    def __init__(self, st: Settings):
+        rounds = st.PWD_HASH_ROUNDS
+        self._ctx = CryptContext(
+            schemes=["pbkdf2_sha256"],
+            default="pbkdf2_sha256",
+            pbkdf2_sha256__default_rounds=rounds,
+            pbkdf2_sha256__min_rounds=rounds,
+            pbkdf2_sha256__max_rounds=rounds,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=st.PWD_HASH_WORKERS,
+            thread_name_prefix="crypt",
+        )
+        self._max_pending = st.PWD_HASH_WORKERS + st.PWD_HASH_QUEUE_SIZE
+        self._pending = 0
+
+    async def _run(self, func: Callable, *args):
+        if self._pending >= self._max_pending:
+            raise AuthException.SERVICE_BUSY
+
+        self._pending += 1
+
+        try:
+            loop = get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, secret: str) -> str:
+        return await self._run(self._ctx.hash, secret)
+
+    async def verify(self, secret: str, hashed: str) -> bool:
+        return await self._run(self._ctx.verify, secret, hashed)
+
+    async def verify_and_update(
+        self, secret: str, hashed: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Return a new hash alongside when the stored one uses outdated cost params"""
+        return await self._run(self._ctx.verify_and_update, secret, hashed)
@@ -6,6 +6,7 @@ class AuthException:
     INVALID_CREDENTIAL = HTTPException(400, "Invalid user credential format")
     DUPLICATE_USER = HTTPException(400, "User already exists")
     INVALID_SOCIAL_TOKEN = HTTPException(400, "User's social token is invalid")
+    SERVICE_BUSY = HTTPException(503, "Too many authentication requests, try again later")
 
     FAIL_GOOGLE_AUTH = HTTPException(400)
     FAIL_FACEBOOK_AUTH = HTTPException(400)
@@ -13,7 +14,14 @@ class AuthException:
 
 class ImageException:
     IMAGE_ONLY = HTTPException(400, "Only images allowed")
+    IMAGE_TOO_LARGE = HTTPException(413, "Image is too large")
+    HASH_MISMATCH = HTTPException(400, "Image does not match its sha256")
+    INVALID_FORM = HTTPException(400, "Invalid multipart form")
+    SINGLE_IMAGE = HTTPException(400, "Only one image per upload")
+    FIELD_TOO_LARGE = HTTPException(413, "Form field is too large")
     IMAGE_NOT_FOUND = HTTPException(404, "Image not found")
+    INVALID_CURSOR = HTTPException(400, "Invalid pagination cursor")
+    INVALID_MANIFEST = HTTPException(400, "Invalid bulk-import manifest")
 
 
 class TagException:
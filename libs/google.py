@@ -0,0 +1,57 @@
+from asyncio import Task, create_task, shield
+from re import search
+from time import time
+from typing import Optional
+
+from google.auth import jwt
+from httpx import AsyncClient
+
+CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+
+def parse_max_age(cache_control: str, default: int = 300) -> int:
+    """Extract max-age (in seconds) from a Cache-Control header"""
+    found = search(r"max-age=(\d+)", cache_control or "")
+    return int(found.group(1)) if found else default
+
+
+class GoogleTokenVerifier:
+    """Verify Google ID-tokens offline against Google's public certs
+    Certs are fetched asynchronously and cached until their Cache-Control expiry,
+    concurrent verifications share a single refresh
+    """
+
+    def __init__(self, client_id: str, certs_url: str = CERTS_URL):
+        self._client_id = client_id
+        self._certs_url = certs_url
+        self._certs: dict = {}
+        self._expire_at: float = 0
+        self._refresh: Optional[Task] = None
+
+    async def fetch_certs(self) -> dict:
+        async with AsyncClient() as client:
+            resp = await client.get(self._certs_url)
+
+        resp.raise_for_status()
+        self._certs = resp.json()
+        self._expire_at = time() + parse_max_age(resp.headers.get("cache-control"))
+        return self._certs
+
+    async def get_certs(self) -> dict:
+        if time() < self._expire_at:
+            return self._certs
+
+        if not self._refresh or self._refresh.done():
+            self._refresh = create_task(self.fetch_certs())
+
+        return await shield(self._refresh)
+
+    async def verify(self, token: str) -> dict:
+        certs = await self.get_certs()
+        claims = jwt.decode(token, certs=certs, audience=self._client_id)
+
+        if claims.get("iss") not in ISSUERS:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+
+        return claims
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from secrets import token_urlsafe
 from typing import Optional, Tuple
 
 from jose.jwt import decode, encode
@@ -16,7 +17,8 @@ class Jwt:
         iat = int(now.timestamp())
         exp = int((now + timedelta(**expire_times)).timestamp())
         issuer = "itms"
-        data.update({"exp": exp, "iat": iat, "issuer": issuer})
+        jti = token_urlsafe(12)
+        data.update({"exp": exp, "iat": iat, "issuer": issuer, "jti": jti})
         jwt = encode(data, self._k, algorithm="HS256")
         return jwt, exp
 
@@ -0,0 +1,27 @@
+from contextvars import ContextVar
+from typing import Any, Mapping
+
+import msgpack
+from fastapi.responses import ORJSONResponse
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+accepted_media_type: ContextVar[str] = ContextVar("accepted_media_type", default=JSON)
+
+
+class FastResponse(ORJSONResponse):
+    """Serialized by orjson, or msgpack when the client negotiated it.
+    The body depends on Accept, so shared caches must key on it too
+    """
+
+    def init_headers(self, headers: Mapping[str, str] = None):
+        super().init_headers(headers)
+        self.headers.add_vary_header("Accept")
+
+    def render(self, content: Any) -> bytes:
+        if accepted_media_type.get() != MSGPACK:
+            return super().render(content)
+
+        self.media_type = MSGPACK
+        return msgpack.packb(content)
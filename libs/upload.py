@@ -0,0 +1,229 @@
+from hashlib import sha256
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from .exceptions import ImageException
+
+SNIFF_SIZE = 8
+
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpeg",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+    b"II*\x00": "tiff",
+    b"MM\x00*": "tiff",
+    b"BM": "bmp",
+}
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Image type from the magic bytes at the start of the file, None if not an image"""
+    for signature, image_type in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return image_type
+
+    return None
+
+
+class MultipartEvents:
+    """Collects the callbacks of the push-based multipart parser as (kind, data) events"""
+
+    def __init__(self, boundary: bytes):
+        self.events: List[Tuple[str, object]] = []
+        self._headers: Dict[str, str] = {}
+        self._field, self._value = b"", b""
+        self._ended = False
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_end": self._on_end,
+            },
+        )
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.decode("latin-1").lower()] = self._value.decode("latin-1")
+        self._field, self._value = b"", b""
+
+    def _on_headers_finished(self):
+        self.events.append(("begin", self._headers))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self.events.append(("data", data[start:end]))
+
+    def _on_part_end(self):
+        self.events.append(("end", None))
+
+    def _on_end(self):
+        self._ended = True
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, object]]:
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError:
+            raise ImageException.INVALID_FORM
+
+        events, self.events = self.events, []
+        return events
+
+    def finalize(self):
+        """The parser doesn't check the body went up to its closing boundary, do it here"""
+        if not self._ended:
+            raise ImageException.INVALID_FORM
+
+
+class FormPart:
+    """A part of a multipart body, its data is read while it is being received"""
+
+    def __init__(self, headers: Dict[str, str], events: AsyncIterator[Tuple[str, object]]):
+        _, options = parse_options_header(headers.get("content-disposition", ""))
+        self.name = options.get(b"name", b"").decode()
+        self.filename = options.get(b"filename", b"").decode() or None
+        self._events = events
+        self._done = False
+
+    async def _next_event(self) -> Tuple[str, object]:
+        try:
+            return await self._events.__anext__()
+        except StopAsyncIteration:
+            raise ImageException.INVALID_FORM
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while not self._done:
+            kind, data = await self._next_event()
+            self._done = kind == "end"
+
+            if not self._done:
+                yield data  # type: ignore
+
+    async def _sized_chunks(self, max_size: int) -> AsyncIterator[bytes]:
+        size = 0
+
+        async for chunk in self.chunks():
+            size += len(chunk)
+
+            if size > max_size:
+                raise ImageException.FIELD_TOO_LARGE
+
+            yield chunk
+
+    async def read(self, max_size: int) -> bytes:
+        """Whole data of a (small) field, FIELD_TOO_LARGE past max_size"""
+        return b"".join([chunk async for chunk in self._sized_chunks(max_size)])
+
+    async def skip(self, max_size: int):
+        """Discard the data left unread, FIELD_TOO_LARGE past max_size"""
+        async for _ in self._sized_chunks(max_size):
+            pass
+
+
+def form_boundary(content_type: str) -> bytes:
+    """Boundary of a multipart/form-data content-type, INVALID_FORM for anything else"""
+    media_type, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+
+    if media_type.strip().lower() != b"multipart/form-data" or not boundary:
+        raise ImageException.INVALID_FORM
+
+    return boundary
+
+
+async def _multipart_events(request: Request) -> AsyncIterator[Tuple[str, object]]:
+    parser = MultipartEvents(form_boundary(request.headers.get("content-type", "")))
+
+    async for chunk in request.stream():
+        for event in parser.feed(chunk):
+            yield event
+
+    parser.finalize()
+
+
+async def iter_form_parts(request: Request, max_skipped_size: int) -> AsyncIterator[FormPart]:
+    """Parse a multipart/form-data body as it arrives, nothing is spooled.
+    Data a part leaves unread is discarded before moving on to the next part,
+    FIELD_TOO_LARGE if there is more than max_skipped_size of it
+    """
+    events = _multipart_events(request)
+
+    async for kind, headers in events:
+        if kind == "begin":
+            part = FormPart(headers, events)  # type: ignore
+            yield part
+            await part.skip(max_skipped_size)
+
+
+class ImageStream:
+    """Checks an uploaded image while it streams through, in a single pass:
+    - rejected after the first bytes if its magic bytes are not an image's
+    - SHA-256 & size computed incrementally
+    - aborted as soon as it grows past max_size
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], max_size: int):
+        self.content_type: Optional[str] = None
+        self.size = 0
+        self._sha256 = sha256()
+        self._chunks = chunks
+        self._head = b""
+        self._max_size = max_size
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    async def _read_head(self):
+        async for chunk in self._chunks:
+            self._head += chunk
+
+            if len(self._head) >= SNIFF_SIZE:
+                return
+
+    async def sniff(self) -> str:
+        """Read just enough to tell the image type"""
+        await self._read_head()
+        image_type = sniff_image_type(self._head)
+
+        if not image_type:
+            raise ImageException.IMAGE_ONLY
+
+        self.content_type = f"image/{image_type}"
+        return self.content_type
+
+    def _check(self, chunk: bytes) -> bytes:
+        self.size += len(chunk)
+
+        if self.size > self._max_size:
+            raise ImageException.IMAGE_TOO_LARGE
+
+        self._sha256.update(chunk)
+        return chunk
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        yield self._check(self._head)
+
+        async for chunk in self._chunks:
+            yield self._check(chunk)
+
+    async def consume(self):
+        """Check the whole image without storing it"""
+        async for _ in self.chunks():
+            pass
@@ -1,26 +1,52 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from contextlib import suppress
+from datetime import datetime
+from functools import wraps
+from inspect import iscoroutinefunction
+from itertools import islice
 from re import findall
-from typing import Callable, List, Optional, Type, TypeVar, Union
+from typing import (Any, Callable, Iterable, Iterator, List, Optional, Tuple,
+                    Type, TypeVar, Union)
+from urllib.parse import urlencode
 from uuid import UUID, uuid4
 
-from google.auth.transport import requests
-from google.oauth2 import id_token
-
 from settings import settings
 
+from .google import GoogleTokenVerifier
+
 T = TypeVar("T")
 
+google_verifier = GoogleTokenVerifier(settings.GOOGLE_APP_CLIENT_ID)
+
+
+def _call(f: Callable, on_exception) -> Callable:
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        with suppress(Exception):
+            return f(*args, **kwargs)
+
+        return on_exception
+
+    return wrapped
+
+
+def _await(f: Callable, on_exception) -> Callable:
+    @wraps(f)
+    async def wrapped(*args, **kwargs):
+        with suppress(Exception):
+            return await f(*args, **kwargs)
+
+        return on_exception
+
+    return wrapped
+
 
 def trying(on_exception=None):
     """A decorator to reduce the boilerplate of try-except"""
 
     def wrapped_(f: Callable):
-        def wrapped(*args, **kwrags):
-            try:
-                return f(*args, **kwrags)
-            except Exception:
-                return on_exception
-
-        return wrapped
+        call = _await if iscoroutinefunction(f) else _call
+        return call(f, on_exception)
 
     return wrapped_
 
@@ -34,22 +60,18 @@ def initialize_model(model: Type[T], **kwargs) -> Optional[T]:
 
 
 @trying(False)
-def validate_google_user(idtoken: str, email: str) -> bool:
+async def validate_google_user(idtoken: str, email: str) -> bool:
     """Validate if User are using valid GoogleAccount to sign-up/login"""
-    idinfo = id_token.verify_oauth2_token(
-        idtoken,
-        requests.Request(),
-        settings.GOOGLE_APP_CLIENT_ID,
-    )
+    idinfo = await google_verifier.verify(idtoken)
     return idinfo.get("email") == email
 
 
 @trying(False)
 def validate_image_file(filename: str):
     """Only accept file name for images of type PNG / JPG / JPEG"""
-    name, ext = filename.lower().split(".")
+    name, _, ext = filename.lower().rpartition(".")
     valid_extensions = ("png", "jpg", "jpeg", "tiff", "bmp", "gif")
-    return name and ext in valid_extensions
+    return bool(name) and ext in valid_extensions
 
 
 def make_storage_key(image_name: str):
@@ -64,6 +86,25 @@ def convert_string_to_uuid(string: str, version=4):
     return uuid_obj
 
 
+def encode_cursor(created_at: datetime, image_id: UUID) -> str:
+    """Opaque pagination cursor pointing right after the given image"""
+    raw = f"{created_at.isoformat()}|{image_id}".encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def next_page_query(last_created_at: datetime, last_id: UUID, **params: Any) -> str:
+    """Query string of the page following the given image, unset params are left out"""
+    params["cursor"] = encode_cursor(last_created_at, last_id)
+    return urlencode({k: v for k, v in params.items() if v is not None})
+
+
+@trying()
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, UUID]]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, image_id = urlsafe_b64decode(padded).decode().split("|")
+    return datetime.fromisoformat(created_at), UUID(image_id)
+
+
 def validate_tag(tag: str) -> bool:
     if len(tag) > 20 or len(tag) < 2:
         return False
@@ -85,3 +126,11 @@ def fix_tags(tags: Union[List[str], str, None]) -> List[str]:
     tag_list = tags.split(",") if isinstance(tags, str) else tags
     valid_tags_only = [t.lower().strip() for t in tag_list if validate_tag(t)]
     return list(set(valid_tags_only))
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Split any iterable into lists of at most `size` items, lazily"""
+    iterator = iter(items)
+
+    while batch := list(islice(iterator, size)):
+        yield batch
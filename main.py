@@ -1,10 +1,18 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 import api
+from dependencies import close_repos, negotiate_media_type
+from libs import FastResponse
 from settings import settings
 
-app = FastAPI(title="IMT-App")
+app = FastAPI(
+    title="IMT-App",
+    default_response_class=FastResponse,
+    dependencies=[Depends(negotiate_media_type)],
+)
+
+app.add_event_handler("shutdown", close_repos)
 
 
 app.add_middleware(
@@ -32,3 +40,9 @@ app.include_router(
     prefix="/v1/tag",
     tags=["Tags"],
 )
+
+app.include_router(
+    api.MetricsRouter,
+    prefix="/v1/metrics",
+    tags=["Metrics"],
+)
@@ -0,0 +1,7 @@
+-- Keyset pagination for tag search:
+-- each searched tag is an ordered range scan on (tag, created_at, image)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "tagged_tag_created_at_image_idx"
+  ON "tagged" ("tag", "created_at" DESC, "image" DESC);
+
+-- Covered by the new index (and the primary key)
+DROP INDEX CONCURRENTLY IF EXISTS "tagged_tag_idx";
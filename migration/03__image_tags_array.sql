@@ -0,0 +1,13 @@
+-- Denormalized tag ids on images, kept in sync on upload,
+-- so that AND/OR tag searches are a single containment/overlap scan
+ALTER TABLE "images" ADD COLUMN IF NOT EXISTS "tags" int[] NOT NULL DEFAULT '{}';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "images_tags_idx"
+  ON "images" USING GIN ("tags");
+
+-- Keyset pagination when the searched tags are too common for the GIN index to pay off
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "images_created_at_id_idx"
+  ON "images" ("created_at" DESC, "id" DESC);
+
+-- Existing rows are populated in batches with:
+-- $ python -m migration.backfill_image_tags
@@ -0,0 +1,93 @@
+-- Range-partition tagged by created_at, one partition per month (UTC),
+-- so indexes stay bounded and date-filtered scans only touch matching months.
+-- Searches filter on created_at with plain parameters, joins on tagged also
+-- match created_at so the planner can prune partitions at run-time too.
+
+-- Partition of the month starting at `month` (UTC), return 1 if created.
+-- Rows the default partition caught for that month are moved into the new partition:
+-- it is filled as a plain table first, then attached, otherwise the check of
+-- the default partition would fail
+CREATE OR REPLACE FUNCTION create_tagged_partition(month timestamp)
+RETURNS int AS $$
+DECLARE
+  partition text := 'tagged_' || to_char(month, 'YYYY_MM');
+  lower_bound timestamptz := month AT TIME ZONE 'UTC';
+  upper_bound timestamptz := (month + interval '1 month') AT TIME ZONE 'UTC';
+BEGIN
+  IF to_regclass(partition) IS NOT NULL THEN
+    RETURN 0;
+  END IF;
+
+  EXECUTE format('CREATE TABLE %I (LIKE "tagged" INCLUDING DEFAULTS)', partition);
+  EXECUTE format(
+    'WITH moved AS ('
+    '  DELETE FROM "tagged_default" WHERE "created_at" >= $1 AND "created_at" < $2 RETURNING *'
+    ') INSERT INTO %I SELECT * FROM moved',
+    partition
+  ) USING lower_bound, upper_bound;
+  EXECUTE format(
+    'ALTER TABLE "tagged" ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+    partition,
+    lower_bound,
+    upper_bound
+  );
+  RETURN 1;
+EXCEPTION
+  -- Created concurrently
+  WHEN duplicate_table THEN
+    RETURN 0;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION create_tagged_partitions(since timestamptz, months_ahead int)
+RETURNS int AS $$
+DECLARE
+  month timestamp := date_trunc('month', since AT TIME ZONE 'UTC');
+  last_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC')
+    + make_interval(months => months_ahead);
+  created int := 0;
+BEGIN
+  WHILE month <= last_month LOOP
+    created := created + create_tagged_partition(month);
+    month := month + interval '1 month';
+  END LOOP;
+
+  RETURN created;
+END
+$$ LANGUAGE plpgsql;
+
+BEGIN;
+
+ALTER TABLE "tagged" RENAME TO "tagged_legacy";
+
+CREATE TABLE "tagged" (
+  "tag" int NOT NULL REFERENCES "tags" ("id") ON DELETE CASCADE,
+  "image" uuid NOT NULL REFERENCES "images" ("id") ON DELETE CASCADE,
+  "created_at" timestamptz NOT NULL DEFAULT current_timestamp,
+  PRIMARY KEY ("tag", "image", "created_at")
+) PARTITION BY RANGE ("created_at");
+
+CREATE INDEX ON "tagged" ("image", "created_at");
+
+-- Catch-all for rows outside of the created partitions, should stay empty
+CREATE TABLE "tagged_default" PARTITION OF "tagged" DEFAULT;
+
+SELECT create_tagged_partitions(coalesce(min("created_at"), now()), 3) FROM "images";
+
+INSERT INTO "tagged" ("tag", "image", "created_at")
+SELECT t."tag", t."image", coalesce(t."created_at", i."created_at", current_timestamp)
+FROM "tagged_legacy" AS t
+JOIN "images" AS i ON i."id" = t."image";
+
+DROP TABLE "tagged_legacy";
+
+-- Searches read images.tags since migration 03: the (tag, created_at, image) index
+-- of migration 02 went away with tagged_legacy and is not recreated, only the
+-- primary key & the (image, created_at) index are maintained on writes
+DROP INDEX IF EXISTS "tagged_tag_created_at_image_idx";
+
+COMMIT;
+
+-- Partitions for the coming months are created ahead of time by the app on start-up,
+-- and should be by a scheduled job as well:
+-- $ pipenv run create-partitions
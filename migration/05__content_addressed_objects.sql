@@ -0,0 +1,53 @@
+-- Content-addressed storage: images with the same content share one stored object.
+-- refs counts the images referencing an object, kept up to date by triggers.
+-- Objects left without reference are deleted after a grace period with:
+-- $ pipenv run gc-objects
+CREATE TABLE IF NOT EXISTS "objects" (
+  "content_hash" varchar PRIMARY KEY,
+  "storage_key" varchar UNIQUE NOT NULL,
+  "refs" int NOT NULL DEFAULT 0,
+  "orphaned_at" timestamptz
+);
+
+CREATE INDEX IF NOT EXISTS "objects_orphaned_at_idx"
+  ON "objects" ("orphaned_at") WHERE "refs" = 0;
+
+ALTER TABLE "images"
+  ADD COLUMN IF NOT EXISTS "content_hash" varchar REFERENCES "objects" ("content_hash");
+
+CREATE INDEX IF NOT EXISTS "images_content_hash_idx"
+  ON "images" ("content_hash") WHERE "content_hash" IS NOT NULL;
+
+-- Images sharing an object share its storage_key, the others still have their own
+CREATE UNIQUE INDEX IF NOT EXISTS "images_storage_key_idx"
+  ON "images" ("storage_key") WHERE "content_hash" IS NULL;
+
+ALTER TABLE "images" DROP CONSTRAINT IF EXISTS "images_storage_key_key";
+
+CREATE OR REPLACE FUNCTION count_object_refs() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE "objects"
+    SET "refs" = "refs" + 1, "orphaned_at" = NULL
+    WHERE "content_hash" = NEW."content_hash";
+  ELSE
+    UPDATE "objects"
+    SET "refs" = "refs" - 1, "orphaned_at" = CASE WHEN "refs" = 1 THEN now() END
+    WHERE "content_hash" = OLD."content_hash";
+  END IF;
+
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "images_object_ref" ON "images";
+CREATE TRIGGER "images_object_ref"
+  AFTER INSERT ON "images"
+  FOR EACH ROW WHEN (NEW."content_hash" IS NOT NULL)
+  EXECUTE FUNCTION count_object_refs();
+
+DROP TRIGGER IF EXISTS "images_object_unref" ON "images";
+CREATE TRIGGER "images_object_unref"
+  AFTER DELETE ON "images"
+  FOR EACH ROW WHEN (OLD."content_hash" IS NOT NULL)
+  EXECUTE FUNCTION count_object_refs();
@@ -0,0 +1,20 @@
+"""Populate images.tags from the tagged table, batch by batch
+Safe to re-run, rows are simply rewritten with the same tag ids
+"""
+import asyncio
+
+from logzero import logger as log
+
+from repository.postgres import Postgres
+from settings import settings
+
+
+async def backfill(batch_size: int = 5000):
+    pg = await Postgres.init(settings)
+    total = await pg.backfill_image_tags(batch_size)
+    log.info("Backfilled tags of %s images", total)
+    await pg.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -27,6 +27,14 @@ class AuthenticatedUser(BaseModel):
     provider: Provider
     token: str
     exp: datetime
+    jti: Optional[str]
+
+    @property
+    def token_id(self) -> str:
+        """Compact key to revoke the token by
+        Tokens issued before `jti` existed fall back to the whole token
+        """
+        return self.jti or self.token
 
 
 class SimpleUserCredential(BaseModel):
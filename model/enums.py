@@ -1,3 +1,5 @@
 from typing import Literal
 
 Provider = Literal["app", "facebook", "google"]
+
+SearchMode = Literal["all", "any"]
@@ -1,9 +1,9 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
 from libs import fix_tags
-from pydantic import AnyHttpUrl, BaseModel
+from pydantic import AnyHttpUrl, BaseModel, conlist, validator
 
 from .enums import Provider
 from .postgres import TaggedImage
@@ -42,12 +42,29 @@ class AuthResponse(BaseModel):
     token_type = "bearer"
 
 
+class UploadImageForm(BaseModel):
+    """Upload FormData, only documented: the form is parsed as a stream, not by FastAPI"""
+
+    image: bytes
+    tags: str = ""
+    sha256: Optional[str]
+
+
+UPLOAD_IMAGE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": UploadImageForm.schema()}},
+    }
+}
+
+
 class UploadImageResponse(BaseModel):
     id: UUID
     name: str
     uploaded_by: Optional[int]
     created_at: datetime
     tags: List[str] = []
+    sha256: Optional[str]
 
 
 class QueryImageResponse(BaseModel):
@@ -59,8 +76,16 @@ class QueryImageResponse(BaseModel):
     tags: List[str] = []
 
     @classmethod
-    def from_tagged_image(cls, img: TaggedImage):
-        return cls(**img.image.dict(), tags=img.tag_names)
+    def from_tagged_image(cls, img: TaggedImage, url: str):
+        """No validation here: response_model validates once at the HTTP boundary"""
+        return cls.construct(
+            id=img.image.id,
+            name=img.image.name,
+            created_at=img.image.created_at,
+            uploaded_by=img.image.uploaded_by,
+            url=url,
+            tags=img.tag_names,
+        )
 
 
 class SearchImagesResponse(BaseModel):
@@ -68,6 +93,15 @@ class SearchImagesResponse(BaseModel):
     next: str = ""
 
 
+class FindImagesByIdsRequest(BaseModel):
+    ids: conlist(UUID, min_items=1, max_items=500)  # type: ignore
+
+
+class FindImagesByIdsResponse(BaseModel):
+    data: List[QueryImageResponse]
+    missing: List[UUID] = []
+
+
 class AddTagsRequest(BaseModel):
     tags: List[str]
 
@@ -79,3 +113,28 @@ class AddTagsRequest(BaseModel):
 
 class AddTagsResponse(BaseModel):
     tags: List[str]
+
+
+class ImportImage(BaseModel):
+    """A line of the bulk-import manifest, the image must already be in storage"""
+
+    name: str
+    storage_key: str
+    tags: List[str] = []
+    created_at: Optional[datetime]
+
+    @validator("tags")
+    def valid_tags_only(cls, tags: List[str]):
+        return fix_tags(tags)
+
+
+class BulkImportResponse(BaseModel):
+    imported: int
+    total: int
+
+
+class MetricsResponse(BaseModel):
+    statements: Dict[str, dict]
+    slow_queries: List[dict]
+    caches: Dict[str, dict]
+    tracking: dict
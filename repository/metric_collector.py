@@ -1,5 +1,10 @@
+from asyncio import Event, Task, TimeoutError, create_task, wait_for
+from collections import deque
+from contextlib import suppress
 from datetime import datetime
+from typing import Deque, List, Optional
 
+from logzero import logger as log
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from model.auth import AuthenticatedUser
@@ -12,11 +17,27 @@ class Collections:
 
 
 class MetricCollector:
-    """For simplicity sake, use MongoDB to collect metrics"""
+    """For simplicity sake, use MongoDB to collect metrics
+    User tracking is buffered in-process and written in batches by a background task,
+    when the buffer is full new events are dropped rather than slowing requests down
+    """
 
-    def __init__(self, conn: AsyncIOMotorClient):
+    def __init__(
+        self,
+        conn: AsyncIOMotorClient,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+    ):
         self.c = conn
         self.db = conn.get_default_database()
+        self.dropped = 0
+        self._buffer: Deque[dict] = deque()
+        self._queue_size = queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._batch_ready: Optional[Event] = None
+        self._flusher: Optional[Task] = None
 
     @classmethod
     async def init(cls, st: Settings):
@@ -24,19 +45,20 @@ class MetricCollector:
             st.MONGO_CONNECTION_STRING,
             serverSelectionTimeoutMS=5000,
         )
-        return cls(client)
+        return cls(
+            client,
+            queue_size=st.TRACKING_QUEUE_SIZE,
+            batch_size=st.TRACKING_BATCH_SIZE,
+            flush_interval=st.TRACKING_FLUSH_INTERVAL,
+        )
 
     async def healthz(self) -> bool:
         """Check if a connection has been established"""
         pong = await self.c.admin.command({"ping": 1})
         return pong == {"ok": 1.0}
 
-    async def collect_user(
-        self,
-        user: AuthenticatedUser,
-        url: str,
-        extra: dict = None,
-    ):
+    @staticmethod
+    def make_tracking_data(user: AuthenticatedUser, url: str, extra: dict = None):
         timestamp = datetime.now().timestamp()
 
         tracking_data = UserTracking(
@@ -49,6 +71,72 @@ class MetricCollector:
         if extra and isinstance(extra, dict):
             tracking_data.update({"extra": extra})
 
-        doc = await self.db[Collections.TRACKING_USERS].insert_one(tracking_data)
+        return tracking_data
 
+    async def collect_user(
+        self,
+        user: AuthenticatedUser,
+        url: str,
+        extra: dict = None,
+    ):
+        tracking_data = self.make_tracking_data(user, url, extra)
+        doc = await self.db[Collections.TRACKING_USERS].insert_one(tracking_data)
         return doc.inserted_id
+
+    def track_user(self, user: AuthenticatedUser, url: str, extra: dict = None) -> bool:
+        """Buffer tracking data without waiting for MongoDB
+        Return False if the event was dropped because the buffer is full
+        """
+        if len(self._buffer) >= self._queue_size:
+            self.dropped += 1
+            return False
+
+        self._buffer.append(self.make_tracking_data(user, url, extra))
+
+        if self._batch_ready and len(self._buffer) >= self._batch_size:
+            self._batch_ready.set()
+
+        return True
+
+    def _next_batch(self) -> List[dict]:
+        size = min(self._batch_size, len(self._buffer))
+        return [self._buffer.popleft() for _ in range(size)]
+
+    async def _write(self, batch: List[dict]):
+        """A failed batch is counted as dropped, never retried"""
+        try:
+            await self.db[Collections.TRACKING_USERS].insert_many(batch, ordered=False)
+        except Exception as err:
+            self.dropped += len(batch)
+            log.error("Failed to write %s tracking events: %s", len(batch), err)
+
+    async def flush(self):
+        """Write all buffered tracking data, batch by batch"""
+        while self._buffer:
+            await self._write(self._next_batch())
+
+    async def _run_flusher(self):
+        """Flush whenever a batch is full, or every flush-interval otherwise"""
+        while True:
+            with suppress(TimeoutError):
+                await wait_for(self._batch_ready.wait(), self._flush_interval)  # type: ignore
+
+            self._batch_ready.clear()  # type: ignore
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), "dropped": self.dropped}
+
+    def start(self):
+        self._batch_ready = Event()
+        self._flusher = create_task(self._run_flusher())
+
+    async def close(self):
+        """Stop the background flusher, then write whatever remains in the buffer"""
+        if self._flusher:
+            self._flusher.cancel()
+
+            with suppress(BaseException):
+                await self._flusher
+
+        await self.flush()
@@ -1,17 +1,145 @@
+from asyncio import (AbstractEventLoop, Queue, Semaphore, create_task, gather,
+                     get_running_loop, run_coroutine_threadsafe)
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import suppress
 from datetime import timedelta
-from tempfile import SpooledTemporaryFile
-from typing import IO, Any, Union
+from functools import partial
+from typing import AsyncIterator, Callable, List, Set, Union
 
 from logzero import logger as log
 from minio import Minio as MinioSDK
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
 
+from libs import LRUCache
 from settings import Settings
 
+PART_SIZE = 5 * 1024 * 1024
+
+
+class ChunkPipe:
+    """File-like object read by the SDK from a worker thread, fed with chunks from the event-loop.
+    The bounded queue holds the producer back when storage is slower than the client,
+    the reader gives up when the client sends nothing for idle_timeout seconds
+    """
+
+    def __init__(self, loop: AbstractEventLoop, maxsize: int = 16, idle_timeout: float = None):
+        self._loop = loop
+        self._chunks: Queue = Queue(maxsize)
+        self._pending = b""
+        self._eof = False
+        self._abandoned = False
+        self._idle_timeout = idle_timeout
+
+    async def put(self, chunk: Union[bytes, Exception, None]):
+        if not self._abandoned:
+            await self._chunks.put(chunk)
+
+    def _drain(self):
+        while not self._chunks.empty():
+            self._chunks.get_nowait()
+
+    def abandon(self):
+        """Reader is gone: drop what is queued and don't block the producer anymore"""
+        self._abandoned = True
+        self._drain()
+
+    async def _put_all(self, chunks: AsyncIterator[bytes]):
+        """Stops early if the reader is gone (failed), the rest has nowhere to go"""
+        async for chunk in chunks:
+            if self._abandoned:
+                return
+
+            await self.put(chunk)
+
+        await self.put(None)
+
+    def _fail(self, err: BaseException):
+        if not self._abandoned:
+            self._drain()
+            reason = err if isinstance(err, Exception) else IOError("upload aborted")
+            self._chunks.put_nowait(reason)
+
+    async def feed(self, chunks: AsyncIterator[bytes]):
+        """Queue all chunks, then the end of data. If the chunks fail, the reader fails too.
+        The SDK only aborts its multipart upload on an Exception: anything else, like
+        a cancellation, reaches the reader as an IOError
+        """
+        try:
+            await self._put_all(chunks)
+        except BaseException as err:
+            self._fail(err)
+            raise
+
+    def _next_chunk(self) -> Union[bytes, Exception, None]:
+        future = run_coroutine_threadsafe(self._chunks.get(), self._loop)
+
+        try:
+            return future.result(self._idle_timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            return IOError("upload idle for too long")
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._pending and not self._eof:
+            chunk = self._next_chunk()
+
+            if isinstance(chunk, Exception):
+                raise chunk
+
+            self._pending, self._eof = chunk or b"", chunk is None
+
+        size = len(self._pending) if size < 0 else size
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+class WorkerPool:
+    """Bounded thread-pool for blocking SDK calls.
+    Waiting for a free worker happens on the event-loop, not in the executor queue
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._limit = Semaphore(max_workers)
+
+    async def run(self, func: Callable, *args, **kwargs):
+        async with self._limit:
+            loop = get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                partial(func, *args, **kwargs),
+            )
+
 
 class Minio:
-    def __init__(self, client: MinioSDK, bucket: str):
+    """Minio SDK is blocking, every call is run on a dedicated & bounded thread-pool
+    so that a slow storage only queues up storage requests, not the event-loop.
+    Streamed uploads hold their worker as long as the client sends data: they have
+    their own pool, so slow clients can't starve the short calls either.
+
+    Presigned urls are the exception: with the region pinned they are signed
+    locally (no network) and cached for half of their lifetime
+    """
+
+    def __init__(
+        self,
+        client: MinioSDK,
+        bucket: str,
+        max_workers: int = 8,
+        max_uploads: int = 32,
+        upload_idle_timeout: float = 30.0,
+        url_expires: timedelta = timedelta(minutes=20),
+        url_cache_size: int = 10000,
+    ):
         self._c = client
         self._bucket = bucket
+        self._url_expires = url_expires
+        self._urls = LRUCache(url_cache_size, ttl=url_expires.total_seconds() / 2)
+        self._workers = WorkerPool(max_workers, "minio")
+        self._uploads = WorkerPool(max_uploads, "minio-upload")
+        self._upload_idle_timeout = upload_idle_timeout
 
     @classmethod
     def init(cls, st: Settings):
@@ -20,6 +148,7 @@ class Minio:
             access_key=st.STORAGE_ACCESS_KEY,
             secret_key=st.STORAGE_SECRET_KEY,
             secure=st.is_prod,
+            region=st.STORAGE_REGION,
         )
         found_bucket = client.bucket_exists(st.STORAGE_BUCKET)
 
@@ -35,24 +164,81 @@ class Minio:
                 st.STORAGE_BUCKET,
             )
 
-        return cls(client, st.STORAGE_BUCKET)
+        return cls(
+            client,
+            st.STORAGE_BUCKET,
+            max_workers=st.STORAGE_MAX_WORKERS,
+            max_uploads=st.STORAGE_MAX_UPLOADS,
+            upload_idle_timeout=st.UPLOAD_IDLE_TIMEOUT,
+            url_expires=timedelta(minutes=st.STORAGE_URL_EXPIRE_MINUTES),
+            url_cache_size=st.STORAGE_URL_CACHE_SIZE,
+        )
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        return await self._workers.run(func, *args, **kwargs)
 
-    def save_image(
-        self, filename: str, file_obj: Union[SpooledTemporaryFile[bytes], IO[Any]]
+    async def save_image(
+        self, storage_key: str, chunks: AsyncIterator[bytes], content_type: str
     ) -> str:
-        _, extension = filename.split(".")
-        content_type = f"image/{extension}"
-        result = self._c.put_object(
-            self._bucket,
-            filename,
-            file_obj,
-            -1,
-            content_type=content_type,
-            part_size=5242880,
-        )
+        """Chunks are fed to the (multipart) upload as they come, nothing is spooled.
+        If the chunks fail, the upload is aborted & the error raised
+        """
+        pipe = ChunkPipe(get_running_loop(), idle_timeout=self._upload_idle_timeout)
+        put_object = partial(self._c.put_object, content_type=content_type, part_size=PART_SIZE)
+        upload = create_task(self._uploads.run(put_object, self._bucket, storage_key, pipe, -1))
+        upload.add_done_callback(lambda _: pipe.abandon())
+
+        try:
+            await pipe.feed(chunks)
+        except BaseException:
+            with suppress(BaseException):
+                await upload
+
+            raise
+
+        result = await upload
         return result.object_name
 
     def get_image(self, image_key: str) -> str:
-        expires = timedelta(minutes=20)
-        url = self._c.presigned_get_object(self._bucket, image_key, expires=expires)
+        url = self._urls.get(image_key)
+
+        if not url:
+            url = self._c.presigned_get_object(
+                self._bucket,
+                image_key,
+                expires=self._url_expires,
+            )
+            self._urls.set(image_key, url)
+
         return url
+
+    def get_images(self, image_keys: List[str]) -> List[str]:
+        return [self.get_image(key) for key in image_keys]
+
+    def _is_stored(self, key: str) -> bool:
+        with suppress(S3Error):
+            return bool(self._c.stat_object(self._bucket, key))
+
+        return False
+
+    async def stored_images(self, image_keys: List[str]) -> Set[str]:
+        """Keys of the given images that are actually in storage"""
+        found = await gather(*[self._run(self._is_stored, key) for key in image_keys])
+        return {key for key, stored in zip(image_keys, found) if stored}
+
+    def _delete_objects(self, keys: List[str]) -> List[str]:
+        objects = [DeleteObject(key) for key in keys]
+        errors = self._c.remove_objects(self._bucket, objects)
+        return [error.name for error in errors]
+
+    async def delete_images(self, image_keys: List[str]) -> List[str]:
+        """Delete stored objects, return the keys that could not be deleted"""
+        failed = await self._run(self._delete_objects, image_keys)
+
+        for key in image_keys:
+            self._urls.delete(key)
+
+        return failed
+
+    def url_cache_stats(self) -> dict:
+        return self._urls.stats()
@@ -0,0 +1,47 @@
+"""Bulk import statements
+Run in order on a single connection & transaction, since they share
+a temporary staging table. Not turned into prepared-statements
+"""
+
+STAGING_IMAGES_COLUMNS = ("id", "name", "storage_key", "created_at", "uploaded_by", "tags")
+
+CREATE_STAGING_IMAGES = """
+CREATE TEMPORARY TABLE staging_images (
+  "id" uuid,
+  "name" varchar,
+  "storage_key" varchar,
+  "created_at" timestamptz,
+  "uploaded_by" int,
+  "tags" varchar[]
+) ON COMMIT DROP
+"""
+
+MERGE_TAGS = """
+INSERT INTO tags (name)
+SELECT DISTINCT unnest(tags) FROM staging_images
+ON CONFLICT (name) DO NOTHING
+"""
+
+MERGE_IMAGES = """
+WITH inserted AS (
+        INSERT INTO images (id, name, storage_key, created_at, uploaded_by, tags)
+        SELECT
+                s.id,
+                s.name,
+                s.storage_key,
+                coalesce(s.created_at, current_timestamp),
+                s.uploaded_by,
+                ARRAY(SELECT tags.id FROM tags WHERE tags.name = ANY(s.tags) ORDER BY tags.id)
+        FROM staging_images AS s
+        -- Keys of shared (content-addressed) objects are known too, only unique per object
+        WHERE NOT EXISTS (SELECT 1 FROM objects AS o WHERE o.storage_key = s.storage_key)
+        ON CONFLICT (storage_key) WHERE content_hash IS NULL DO NOTHING
+        RETURNING id, created_at, tags
+),
+linked AS (
+        INSERT INTO tagged (tag, image, created_at)
+        SELECT unnest(tags), id, created_at
+        FROM inserted
+)
+SELECT count(*) FROM inserted
+"""
@@ -1,56 +1,297 @@
-from datetime import datetime, timedelta
-from typing import List, Optional
+from asyncio import Task, create_task, get_running_loop
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from time import perf_counter, time
+from typing import (IO, AsyncIterator, Awaitable, Callable, Deque, Dict,
+                    Iterator, List, Optional, Set, Tuple)
 from uuid import UUID, uuid4
 
+import repository.postgres.bulk_queries as BulkQueries
 import repository.postgres.queries as PsqlQueries
-from asyncpg import Connection, connect
+from asyncpg import Connection, Record, create_pool
+from asyncpg.exceptions import ForeignKeyViolationError
+from asyncpg.pool import Pool
+from libs import LRUCache, batched
 from logzero import logger as log  # noqa
-from model.enums import Provider
+from model.enums import Provider, SearchMode
+from model.http import ImportImage
 from model.postgres import Image, Tag, TaggedImage, User
 from settings import Settings
 
+from .replicas import Replicas
+from .stats import StatementStats, count_rows
+
+MAX_UUID = UUID(int=2**128 - 1)
+
+# Finds which of the given storage keys are actually in storage
+StoredKeys = Callable[[List[str]], Awaitable[Set[str]]]
+DeleteStored = Callable[[List[str]], Awaitable[List[str]]]
+
+# Statements safe to run on a read-replica
+READ_ONLY_QUERIES = (
+    "FIND_USER_BY_EMAIL",
+    "FIND_USER_BY_ID",
+    "FIND_IMAGE_BY_ID",
+    "FIND_IMAGES_BY_IDS",
+    "FIND_TAGS_BY_NAMES",
+    "LIST_TAGS",
+    "SEARCH_IMAGES_ALL_TAGS",
+    "SEARCH_IMAGES_ANY_TAGS",
+)
+
+
+IMAGE_FIELDS = tuple(Image.__fields__)
+
+
+def to_tags(values: List[Record]) -> List[Tag]:
+    """Tags come from the DB as native arrays of (id, name) composites"""
+    return [Tag.construct(id=t["id"], name=t["name"]) for t in values]
+
+
+def to_tagged_image(record: Record) -> TaggedImage:
+    """Rows are trusted and built without validation, the API validates what it returns"""
+    image = Image.construct(**{f: record[f] for f in IMAGE_FIELDS})
+    return TaggedImage.construct(image=image, tags=to_tags(record["tags"]))
+
+
+def _parse_manifest_batch(batches: Iterator[List]) -> Optional[List[ImportImage]]:
+    lines = next(batches, None)
+
+    if lines is None:
+        return None
+
+    return [ImportImage.parse_raw(line) for line in lines if line.strip()]
+
+
+async def read_manifest(manifest: IO, batch_size: int) -> AsyncIterator[List[ImportImage]]:
+    """Read & parse a manifest batch by batch in a worker thread, off the event-loop"""
+    loop = get_running_loop()
+    batches = batched(manifest, batch_size)
+
+    while (batch := await loop.run_in_executor(None, _parse_manifest_batch, batches)) is not None:
+        yield batch
+
 
 class PreparedStm:
-    """Turn all raw queries into prepared-statements"""
+    """Turn all raw queries into prepared-statements
+    Every call acquires a connection from the pool, statements are
+    prepared & cached per connection by asyncpg itself (statement_cache_size):
+    prepared statements can't outlive the acquire they were made in.
+    Broken connections are closed and replaced by the pool on next acquire,
+    their cached statements go away with them.
+    Read-only statements go to a healthy replica, if any, unless primary=True.
+
+    Every call is recorded in per-statement stats. Calls slower than
+    `slow_query_threshold` are logged with their plan, at most once a minute
+    per statement. Plans show the bound arguments: metrics only expose the
+    statement names & timings of slow queries
+    """
+
+    def __init__(self, acquire_timeout: float = None, slow_query_threshold: float = None):
+        self.pool: Optional[Pool] = None
+        self.replicas: Optional[Replicas] = None
+        self.timeout = acquire_timeout
+        self.stats: Dict[str, StatementStats] = {}
+        self.slow_queries: Deque[dict] = deque(maxlen=100)
+        self.slow_query_threshold = slow_query_threshold
+        self._last_explained: Dict[str, float] = {}
+        self._explaining: Set[Task] = set()
 
-    async def prepare(self, conn: Connection):
+    async def prepare(self, pool: Pool, replicas: Replicas = None):
+        self.pool = pool
+        self.replicas = replicas
         query_names = [q for q in dir(PsqlQueries) if q.isupper()]
 
         for name in query_names:
-            query_stm: str = getattr(PsqlQueries, name)
+            self.stats[name] = StatementStats()
+            setattr(self, name, self.__get_fetch__(name))
+
+    def pool_for(self, name: str, primary: bool) -> Pool:
+        replica = None
+
+        if not primary and self.replicas and name in READ_ONLY_QUERIES:
+            replica = self.replicas.pick()
+
+        return replica or self.pool  # type: ignore
+
+    async def _plan(self, pool: Pool, name: str, args: tuple) -> str:
+        """EXPLAIN ANALYZE executes the statement: only read-only ones are analyzed,
+        in a rolled-back transaction all the same. Others are just planned
+        """
+        query_stm: str = getattr(PsqlQueries, name)
+        explain = "EXPLAIN (ANALYZE, BUFFERS)" if name in READ_ONLY_QUERIES else "EXPLAIN"
+
+        async with pool.acquire(timeout=self.timeout) as conn:
+            tr = conn.transaction()
+            await tr.start()
+
+            try:
+                rows = await conn.fetch(f"{explain} {query_stm}", *args)
+            finally:
+                await tr.rollback()
 
-            async def __get_fetch__(query_statement: str):
-                prepared = await conn.prepare(query_statement)
+        return "\n".join(r[0] for r in rows)
 
-                async def wrapped(*args, method="fetch"):
-                    nonlocal conn, prepared
-                    fetcher = getattr(prepared, method)
-                    result = await fetcher(*args)
-                    return result
+    async def explain(self, pool: Pool, name: str, args: tuple, elapsed: float):
+        try:
+            plan = await self._plan(pool, name, args)
+        except Exception as err:
+            log.warning("Slow query %s took %.3fs, could not explain it: %r", name, elapsed, err)
+            return
 
-                return wrapped
+        self.slow_queries.append({"statement": name, "elapsed": elapsed, "plan": plan})
+        log.warning("Slow query %s took %.3fs:\n%s", name, elapsed, plan)
 
-            method = await __get_fetch__(query_stm)
-            setattr(self, name, method)
+    def _on_slow_query(self, pool: Pool, name: str, args: tuple, elapsed: float):
+        now = time()
+
+        if now - self._last_explained.get(name, 0) < 60:
+            return
+
+        self._last_explained[name] = now
+        task = create_task(self.explain(pool, name, args, elapsed))
+        self._explaining.add(task)
+        task.add_done_callback(self._explaining.discard)
+
+    async def _timed(self, conn: Connection, name: str, method: str, args: tuple):
+        """Only the statement itself is timed, not the wait for a pooled connection"""
+        start = perf_counter()
+
+        try:
+            result = await getattr(conn, method)(getattr(PsqlQueries, name), *args)
+        except Exception:
+            self.stats[name].record(perf_counter() - start, error=True)
+            raise
+
+        elapsed = perf_counter() - start
+        self.stats[name].record(elapsed, rows=count_rows(result))
+        return result, elapsed
+
+    def __get_fetch__(self, name: str):
+        async def wrapped(*args, method="fetch", primary=False):
+            pool = self.pool_for(name, primary)
+
+            async with pool.acquire(timeout=self.timeout) as conn:
+                result, elapsed = await self._timed(conn, name, method, args)
+
+            if self.slow_query_threshold and elapsed > self.slow_query_threshold:
+                self._on_slow_query(pool, name, args, elapsed)
+
+            return result
+
+        return wrapped
+
+    def metrics(self) -> dict:
+        return {
+            "statements": {
+                name: stats.to_dict() for name, stats in self.stats.items() if stats.calls
+            },
+            "slow_queries": [
+                {"statement": slow["statement"], "elapsed": slow["elapsed"]}
+                for slow in self.slow_queries
+            ],
+        }
 
 
 class Postgres:
-    def __init__(self, conn: Connection, queries: PreparedStm):
-        self.c = conn
+    """Tag vocabulary is small & stable: names are resolved to ids through
+    an in-process cache, warmed at startup and filled on every upsert.
+
+    Reads may be served by replicas: an uploader keeps reading from the primary
+    for a short while after writing, and lookups missing on a replica are
+    retried on the primary
+    """
+
+    def __init__(
+        self,
+        pool: Pool,
+        queries: PreparedStm,
+        tag_cache_size: int = 50000,
+        read_your_writes_window: float = 10.0,
+    ):
+        self.c = pool
         self.q = queries
+        self.tags = LRUCache(tag_cache_size)
+        self.recent_writers = LRUCache(100000, ttl=read_your_writes_window)
+
+    @staticmethod
+    async def create_pool(st: Settings, **connect_kwargs) -> Pool:
+        connect_kwargs.setdefault("min_size", st.PG_POOL_MIN_SIZE)
+        return await create_pool(max_size=st.PG_POOL_MAX_SIZE, **connect_kwargs)
+
+    @classmethod
+    async def create_replica_pool(cls, st: Settings, dsn: str) -> Optional[Pool]:
+        """Replica pools connect lazily: an unreachable replica doesn't fail the startup,
+        it stays ejected until the lag check reaches it
+        """
+        try:
+            return await cls.create_pool(st, dsn=dsn, min_size=0)
+        except Exception as err:
+            log.error("Replica pool could not be created, skipped: %s", err)
+            return None
 
     @classmethod
     async def init(cls, st: Settings):
-        conn = await connect(
+        q = PreparedStm(
+            acquire_timeout=st.PG_ACQUIRE_TIMEOUT,
+            slow_query_threshold=st.PG_SLOW_QUERY_THRESHOLD,
+        )
+        pool = await cls.create_pool(
+            st,
             user=st.PG_USER,
             password=st.PG_PWD,
             database=st.PG_DATABASE,
             host=st.PG_HOST,
             port=st.PG_PORT,
         )
-        q = PreparedStm()
-        await q.prepare(conn)
-        return cls(conn, q)
+        replica_pools = [await cls.create_replica_pool(st, dsn) for dsn in st.PG_REPLICA_DSNS]
+        replicas = Replicas(
+            [replica for replica in replica_pools if replica],
+            max_lag=st.PG_REPLICA_MAX_LAG,
+            check_interval=st.PG_REPLICA_CHECK_INTERVAL,
+        )
+        replicas.start()
+        await q.prepare(pool, replicas)
+        pg = cls(
+            pool,
+            q,
+            tag_cache_size=st.TAG_CACHE_SIZE,
+            read_your_writes_window=st.PG_READ_YOUR_WRITES_WINDOW,
+        )
+        await pg.warm_tag_cache()
+        return pg
+
+    async def close(self):
+        await self.q.replicas.close()  # type: ignore
+        await self.c.close()
+
+    def _mark_writer(self, user_id: Optional[int]):
+        if user_id:
+            self.recent_writers.set(user_id, True)
+
+    def _wrote_recently(self, user_id: Optional[int]) -> bool:
+        return bool(user_id and self.recent_writers.get(user_id))
+
+    def _cache_tags(self, tags: List[Tag]):
+        for tag in tags:
+            self.tags.set(tag.name, tag.id)
+
+    async def warm_tag_cache(self):
+        records = await self.q.LIST_TAGS(self.tags.maxsize)  # type: ignore
+        self._cache_tags([Tag(**r) for r in records])
+
+    async def get_tag_ids(self, names: List[str], primary: bool = False) -> Dict[str, int]:
+        """Resolve tag names to ids, unknown tags are left out (and not cached)"""
+        found = {name: self.tags.get(name) for name in names}
+        missing = [name for name, tag_id in found.items() if tag_id is None]
+
+        if missing:
+            records = await self.q.FIND_TAGS_BY_NAMES(missing, primary=primary)  # type: ignore
+            tags = [Tag(**r) for r in records]
+            self._cache_tags(tags)
+            found.update({tag.name: tag.id for tag in tags})
+
+        return {name: tag_id for name, tag_id in found.items() if tag_id is not None}
 
     async def save_user(self, email: str, pwd: str) -> Optional[User]:
         """Register new user to database using email & password"""
@@ -58,21 +299,34 @@ class Postgres:
         record = await self.q.REGISTER_NEW_USER_APP(*args, method="fetchrow")  # type: ignore
         return User(**record) if record else None
 
+    async def update_user_password(self, user_id: int, pwd: str):
+        """Replace user's password hash, ie when hashing cost params have changed"""
+        await self.q.UPDATE_USER_PASSWORD(pwd, user_id, method="fetch")  # type: ignore
+
+    async def _read_row(self, query, *args, primary: bool = False):
+        """A row missing on a replica may just not be replicated yet, ask the primary"""
+        record = await query(*args, method="fetchrow", primary=primary)
+
+        if record or primary or not self.q.replicas.healthy:  # type: ignore
+            return record
+
+        return await query(*args, method="fetchrow", primary=True)
+
     async def get_user(self, email: str = None, user_id: str = None) -> Optional[User]:
         """Get user data from email or user_id"""
-        records = await (
-            self.q.FIND_USER_BY_EMAIL(email)  # type: ignore
+        record = await (
+            self._read_row(self.q.FIND_USER_BY_EMAIL, email)  # type: ignore
             if email
-            else self.q.FIND_USER_BY_ID(user_id)  # type: ignore
+            else self._read_row(self.q.FIND_USER_BY_ID, user_id)  # type: ignore
         )
-        return User(**records[0]) if records else None
+        return User(**record) if record else None
 
     async def save_social_user(
         self, email: str, token: str, timestamp: int, provider: Provider
     ) -> User:
         """Register/update user to database using his social-login"""
         time = datetime.fromtimestamp(timestamp)
-        result = await self.q.FIND_USER_BY_EMAIL(email)  # type: ignore
+        result = await self.q.FIND_USER_BY_EMAIL(email, primary=True)  # type: ignore
 
         if not result:
             args = (email, token, time, provider)
@@ -93,26 +347,61 @@ class Postgres:
         image_name: str,
         storage_key: str,
         uploader: int,
+        tag_ids: List[int] = None,
     ) -> Image:
-        args = (uuid4(), image_name, storage_key, uploader)
+        args = (uuid4(), image_name, storage_key, uploader, tag_ids or [])
         record = await self.q.INSERT_NEW_IMAGE(*args, method="fetchrow")  # type: ignore
+        self._mark_writer(uploader)
         return Image(**record)
 
-    async def get_image(self, id: UUID) -> Optional[TaggedImage]:
-        record = await self.q.FIND_IMAGE_BY_ID(id, method="fetchrow")  # type: ignore
+    async def get_image(self, id: UUID, user_id: int = None) -> Optional[TaggedImage]:
+        find = self.q.FIND_IMAGE_BY_ID  # type: ignore
+        record = await self._read_row(find, id, primary=self._wrote_recently(user_id))
 
         if not record:
             return None
 
-        image = Image(**record)
-        tags = [Tag(name=t) for t in (record["tags"] or "").split(",") if t]
+        return to_tagged_image(record)
 
-        return TaggedImage(image=image, tags=tags)
+    async def get_images(self, ids: List[UUID], user_id: int = None) -> List[TaggedImage]:
+        """Images found among the ids, in no particular order.
+        Ids missing on a replica may just not be replicated yet, they are asked to the primary
+        """
+        primary = self._wrote_recently(user_id)
+        records = await self.q.FIND_IMAGES_BY_IDS(ids, primary=primary)  # type: ignore
+        missing = set(ids) - {r["id"] for r in records}
+
+        if missing and not primary and self.q.replicas.healthy:  # type: ignore
+            records += await self.q.FIND_IMAGES_BY_IDS(list(missing), primary=True)  # type: ignore
+
+        return [to_tagged_image(r) for r in records]
 
     async def save_tags(self, tags: List[str]) -> List[Tag]:
-        values = [(None, t) for t in tags]
-        records = await self.q.UPSERT_TAGS(values)  # type: ignore
-        return [Tag(**r) for r in records]
+        records = await self.q.UPSERT_TAGS(tags)  # type: ignore
+        saved_tags = [Tag(**r) for r in records]
+        self._cache_tags(saved_tags)
+        return saved_tags
+
+    async def _save_image_with_known_tags(
+        self,
+        image_name: str,
+        storage_key: str,
+        uploader: int,
+        tags: List[Tag],
+        content_hash: Optional[str],
+    ) -> Optional[TaggedImage]:
+        """None when some cached tag has been deleted meanwhile, the tag cache is reset then"""
+        tag_ids = [tag.id for tag in tags]
+        args = (uuid4(), image_name, storage_key, uploader, tag_ids, content_hash)
+
+        try:
+            record = await self.q.SAVE_IMAGE_WITH_TAG_IDS(*args, method="fetchrow")  # type: ignore
+        except ForeignKeyViolationError:
+            self.tags.clear()
+            return None
+
+        self._mark_writer(uploader)
+        return TaggedImage(image=Image(**record), tags=tags)
 
     async def save_tagged_image(
         self,
@@ -120,42 +409,176 @@ class Postgres:
         storage_key: str,
         uploader: int,
         tags: List[str],
+        content_hash: str = None,
     ) -> TaggedImage:
-        image = await self.save_image(image_name, storage_key, uploader)
-        saved_tags = await self.save_tags(tags) if tags else []
-        data = [(tag.id, image.id, image.created_at) for tag in saved_tags]
-        await self.q.INSERT_TAGGED_IMAGE(data)  # type: ignore
-        return TaggedImage(image=image, tags=saved_tags, created_at=image.created_at)
+        """Upsert tags, insert image & link them all in a single statement
+        Upsert is skipped when every tag is already known.
+        With a content_hash, the image references the stored object of that content:
+        the returned storage_key is the existing object's one if the content is known
+        """
+        names = list(dict.fromkeys(tags))
+        known = [Tag(id=self.tags.get(name, -1), name=name) for name in names]
+
+        if all(tag.id > 0 for tag in known):
+            args = (image_name, storage_key, uploader, known, content_hash)
+            saved = await self._save_image_with_known_tags(*args)
+
+            if saved:
+                return saved
+
+        args = (uuid4(), image_name, storage_key, uploader, names, content_hash)
+        record = await self.q.SAVE_TAGGED_IMAGE(*args, method="fetchrow")  # type: ignore
+        saved_tags = to_tags(record["tags"])
+        self._cache_tags(saved_tags)
+        self._mark_writer(uploader)
+        return TaggedImage(image=Image(**record), tags=saved_tags)
+
+    async def find_object(self, content_hash: str) -> Optional[str]:
+        """Storage key of the object already stored with this content, if any"""
+        return await self.q.FIND_OBJECT(content_hash, method="fetchval")  # type: ignore
+
+    async def delete_orphaned_objects(
+        self, grace: timedelta, delete_stored: DeleteStored, batch_size: int = 1000
+    ) -> List[str]:
+        """Delete a batch of objects no image has referenced for a while: from storage first,
+        then their rows. Rows stay locked meanwhile, an upload of the same content waits
+        instead of reusing an object being deleted. Keys `delete_stored` fails on are kept
+        for the next run. Return the storage keys deleted
+        """
+        async with self.c.acquire(timeout=self.q.timeout) as conn:
+            async with conn.transaction():
+                records = await conn.fetch(PsqlQueries.LOCK_ORPHANED_OBJECTS, grace, batch_size)
+                keys = [r["storage_key"] for r in records]
+                failed = set(await delete_stored(keys))
+                deleted = [key for key in keys if key not in failed]
+                await conn.execute(PsqlQueries.DELETE_OBJECTS, deleted)
+
+        return deleted
 
     async def search_image_by_tags(
         self,
         tags: List[str],
         limit: int,
         previous_id: UUID = None,
-        from_date=datetime.fromtimestamp(0),
-        to_date=datetime.now() + timedelta(minutes=1),
+        from_date: datetime = None,
+        to_date: datetime = None,
+        mode: SearchMode = "any",
+        user_id: int = None,
+        primary: bool = False,
     ) -> List[TaggedImage]:
-        tag_param = [(None, t) for t in tags]
-        records = []
-
-        if not previous_id:
-            no_paging = (tag_param, limit, from_date, to_date)
-            records = await self.q.SEARCH_TAGGED_IMAGES(*no_paging)  # type: ignore
-        else:
-            paging = (tag_param, limit, from_date, to_date, previous_id)
-            records = await self.q.SEARCH_TAGGED_IMAGES_WITH_PAGE(*paging)  # type: ignore
-
-        result = []
-
-        for r in records:
-            image = Image(**r)
-            tag_strings = r["tags"].split(",")
-            img_tags = [Tag(name=t) for t in tag_strings]
-            tagged_img = TaggedImage(
-                image=image,
-                tags=img_tags,
-                created_at=image.created_at,
-            )
-            result.append(tagged_img)
-
-        return result
+        """Find images having all/any of the tags, using keyset pagination
+        ordered by (created_at, id) descending.
+        Next page starts right after (to_date, previous_id) of the last image found.
+        With primary, tags are resolved on the primary too: recent tags may be
+        unknown to a lagging replica
+        """
+        from_date = from_date or datetime.fromtimestamp(0)
+        to_date = to_date or datetime.now() + timedelta(minutes=1)
+        previous_id = previous_id or MAX_UUID
+        primary = primary or self._wrote_recently(user_id)
+
+        tag_ids = await self.get_tag_ids(tags, primary=primary)
+
+        if not tag_ids or (mode == "all" and len(tag_ids) < len(set(tags))):
+            return []
+
+        search = (
+            self.q.SEARCH_IMAGES_ALL_TAGS  # type: ignore
+            if mode == "all"
+            else self.q.SEARCH_IMAGES_ANY_TAGS  # type: ignore
+        )
+        args = (list(tag_ids.values()), limit, from_date, to_date, previous_id)
+        records = await search(*args, primary=primary)
+
+        return [to_tagged_image(r) for r in records]
+
+    async def backfill_image_tags(self, batch_size: int = 5000) -> int:
+        """Populate images.tags from tagged for all existing images"""
+        last_id, count = UUID(int=0), 0
+
+        while True:
+            args = (last_id, batch_size)
+            batch = await self.q.BACKFILL_IMAGE_TAGS(*args, method="fetchrow")  # type: ignore
+
+            if not batch["size"]:
+                return count
+
+            last_id, count = batch["last_id"], count + batch["size"]
+            log.info("Backfilled images.tags of %s images", count)
+
+    async def create_partitions(self, months_ahead: int, since: datetime = None) -> int:
+        """Create monthly partitions of tagged up to months_ahead, return how many are new"""
+        since = since or datetime.now(timezone.utc)
+        args = (since, months_ahead)
+        return await self.q.CREATE_TAGGED_PARTITIONS(*args, method="fetchval")  # type: ignore
+
+    async def create_partitions_of(self, moments: List[Optional[datetime]]) -> int:
+        """Create the monthly partitions of tagged these moments fall in (None for now),
+        return how many are new
+        """
+        return await self.q.CREATE_PARTITIONS_OF_MONTHS(moments, method="fetchval")  # type: ignore
+
+    async def bulk_import_images(
+        self,
+        images: List[ImportImage],
+        uploader: int = None,
+    ) -> int:
+        """COPY a batch of images into a staging table, then merge it set-wise
+        into images, tags & tagged within one transaction.
+        Partitions of the months imported are created beforehand, out of the transaction.
+        Images whose storage_key already exists are skipped
+        """
+        await self.create_partitions_of([i.created_at for i in images])
+
+        records = [
+            (uuid4(), i.name, i.storage_key, i.created_at, uploader, i.tags)
+            for i in images
+        ]
+
+        async with self.c.acquire(timeout=self.q.timeout) as conn:
+            async with conn.transaction():
+                await conn.execute(BulkQueries.CREATE_STAGING_IMAGES)
+                await conn.copy_records_to_table(
+                    "staging_images",
+                    records=records,
+                    columns=BulkQueries.STAGING_IMAGES_COLUMNS,
+                )
+                await conn.execute(BulkQueries.MERGE_TAGS)
+                imported = await conn.fetchval(BulkQueries.MERGE_IMAGES)
+
+        self._mark_writer(uploader)
+        return imported
+
+    async def _import_stored(
+        self, batch: List[ImportImage], uploader: Optional[int], stored: Optional[StoredKeys]
+    ) -> int:
+        if stored:
+            keys = await stored([i.storage_key for i in batch])
+            batch = [i for i in batch if i.storage_key in keys]
+
+        return await self.bulk_import_images(batch, uploader)
+
+    async def import_manifest(
+        self,
+        manifest: IO,
+        uploader: int = None,
+        batch_size: int = 10000,
+        stored: StoredKeys = None,
+    ) -> Tuple[int, int]:
+        """Import a manifest file of one JSON image per line, batch by batch.
+        The whole manifest is validated before anything is written.
+        With `stored`, images whose storage_key is not actually in storage are skipped.
+        Return the number of images imported & read
+        """
+        async for _ in read_manifest(manifest, batch_size):
+            pass
+
+        manifest.seek(0)
+        imported, total = 0, 0
+
+        async for batch in read_manifest(manifest, batch_size):
+            imported += await self._import_stored(batch, uploader, stored)
+            total += len(batch)
+            log.info("Bulk import: %s imported out of %s read", imported, total)
+
+        return imported, total
@@ -25,6 +25,12 @@ SET token = $1, expire_at = $2, provider = $3
 WHERE email = $4 RETURNING *
 """
 
+UPDATE_USER_PASSWORD = """
+UPDATE users
+SET password = $1
+WHERE id = $2
+"""
+
 GET_USER_TOKEN = """
 SELECT token
 FROM users
@@ -32,125 +38,241 @@ WHERE email = $1 AND expire_at > current_timestamp
 """
 
 INSERT_NEW_IMAGE = """
-INSERT INTO images (id, name, storage_key, uploaded_by)
-VALUES ($1, $2, $3, $4)
+INSERT INTO images (id, name, storage_key, uploaded_by, tags)
+VALUES ($1, $2, $3, $4, $5)
 RETURNING *
 """
 
 FIND_IMAGE_BY_ID = """
-WITH img AS (
-    SELECT * FROM images WHERE id = $1
-),
-tag_ids AS (
-    SELECT *
-    FROM tagged
-    WHERE image = $1
-),
-tag_names AS (
-    SELECT string_agg(name, ',') AS tags
-    FROM tags
-    WHERE id IN (SELECT tag FROM tag_ids)
-)
-SELECT *
-FROM img
-LEFT JOIN tag_names ON TRUE;
+SELECT
+        img.id,
+        img.name,
+        img.storage_key,
+        img.created_at,
+        img.uploaded_by,
+        ARRAY(SELECT t FROM tags AS t WHERE t.id = ANY(img.tags) ORDER BY t.id) AS tags
+FROM images AS img
+WHERE img.id = $1
 """
 
-UPSERT_TAGS = """
-WITH items (name) AS (SELECT r.name FROM unnest($1::tags[]) as r),
-     added        AS
-(
-    INSERT INTO tags (name)
-    SELECT name FROM items
-    EXCEPT
-    SELECT name FROM tags
-    RETURNING id, name
-)
+FIND_IMAGES_BY_IDS = """
+SELECT
+        img.id,
+        img.name,
+        img.storage_key,
+        img.created_at,
+        img.uploaded_by,
+        ARRAY(SELECT t FROM tags AS t WHERE t.id = ANY(img.tags) ORDER BY t.id) AS tags
+FROM images AS img
+WHERE img.id = ANY($1::uuid[])
+"""
 
-SELECT id, name FROM added
-UNION ALL
-SELECT id, name FROM tags
-WHERE name IN (SELECT name FROM items)
+LIST_TAGS = """
+SELECT id, name
+FROM tags
+ORDER BY id
+LIMIT $1
 """
 
-INSERT_TAGGED_IMAGE = """
-INSERT INTO tagged (tag, image, created_at)
-(SELECT r.tag, r.image, r.created_at FROM unnest($1::tagged[]) as r)
-RETURNING *
+FIND_TAGS_BY_NAMES = """
+SELECT id, name
+FROM tags
+WHERE name = ANY($1::varchar[])
 """
 
-SEARCH_TAGGED_IMAGES = """
-WITH tag_items AS (
+UPSERT_TAGS = """
+WITH items AS (
+        SELECT DISTINCT unnest($1::varchar[]) AS name
+),
+existing AS (
         SELECT id, name
         FROM tags
-        WHERE name IN (SELECT r.name FROM unnest($1::tags[]) as r)
-),
-image_ids AS (
-        SELECT image
-        FROM tagged
-        WHERE tag in (SELECT id FROM tag_items)
-        AND created_at >= $3 AND created_at <= $4
-        GROUP BY image, created_at
-        ORDER BY created_at DESC
-        LIMIT $2
-),
-image_tag_ids AS (
-        SELECT image, tag
-        FROM tagged
-        WHERE image in (SELECT image FROM image_ids)
+        WHERE name IN (SELECT name FROM items)
 ),
-image_tags AS (
-        SELECT image, string_agg(tags.name, ',') as tags
-        FROM image_tag_ids
-        LEFT JOIN tags
-        ON image_tag_ids.tag = tags.id
-        GROUP BY image
-),
-image_tags_full_info AS (
-
-SELECT images.*, image_tags.tags
-        FROM image_tags
-        LEFT JOIN images
-        ON image_tags.image = images.id
-        ORDER BY images.created_at DESC
+added AS (
+        -- DO UPDATE, not DO NOTHING: a tag inserted by a concurrent upload
+        -- is invisible to this statement's snapshot, but locked & returned here
+        INSERT INTO tags (name)
+        SELECT name FROM items
+        WHERE name NOT IN (SELECT name FROM existing)
+        ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id, name
 )
-SELECT * FROM image_tags_full_info
+SELECT id, name FROM existing
+UNION ALL
+SELECT id, name FROM added
 """
 
-SEARCH_TAGGED_IMAGES_WITH_PAGE = """
-WITH tag_items AS (
+SAVE_TAGGED_IMAGE = """
+WITH items AS (
+        SELECT DISTINCT unnest($5::varchar[]) AS name
+),
+existing AS (
         SELECT id, name
         FROM tags
-        WHERE name IN (SELECT r.name FROM unnest($1::tags[]) as r)
+        WHERE name IN (SELECT name FROM items)
 ),
-image_ids AS (
-        SELECT image
-        FROM tagged
-        WHERE tag in (SELECT id FROM tag_items)
-        AND (created_at, image) >= ($3, $5)
-        AND (created_at, image) < ($4, $5)
-        GROUP BY image, created_at
-        ORDER BY created_at DESC
-        LIMIT $2
+added AS (
+        INSERT INTO tags (name)
+        SELECT name FROM items
+        WHERE name NOT IN (SELECT name FROM existing)
+        ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id, name
 ),
-image_tag_ids AS (
-        SELECT image, tag
-        FROM tagged
-        WHERE image in (SELECT image FROM image_ids)
+saved_tags AS (
+        SELECT id, name FROM existing
+        UNION ALL
+        SELECT id, name FROM added
 ),
-image_tags AS (
-        SELECT image, string_agg(tags.name, ',') as tags
-        FROM image_tag_ids
-        LEFT JOIN tags
-        ON image_tag_ids.tag = tags.id
-        GROUP BY image
+stored_object AS (
+        INSERT INTO objects (content_hash, storage_key)
+        SELECT $6::varchar, $3
+        WHERE $6::varchar IS NOT NULL
+        ON CONFLICT (content_hash) DO UPDATE SET content_hash = EXCLUDED.content_hash
+        RETURNING storage_key
 ),
-image_tags_full_info AS (
-        SELECT images.*, image_tags.tags
-        FROM image_tags
-        LEFT JOIN images
-        ON image_tags.image = images.id
-        ORDER BY images.created_at DESC
+image AS (
+        INSERT INTO images (id, name, storage_key, uploaded_by, tags, content_hash)
+        VALUES (
+                $1,
+                $2,
+                coalesce((SELECT storage_key FROM stored_object), $3),
+                $4,
+                ARRAY(SELECT id FROM saved_tags ORDER BY id),
+                $6::varchar
+        )
+        RETURNING id, name, storage_key, created_at, uploaded_by
+),
+linked AS (
+        INSERT INTO tagged (tag, image, created_at)
+        SELECT saved_tags.id, image.id, image.created_at
+        FROM saved_tags, image
 )
-SELECT * FROM image_tags_full_info
+SELECT
+        image.*,
+        ARRAY(SELECT ROW(id, name)::tags FROM saved_tags ORDER BY id) AS tags
+FROM image
+"""
+
+SAVE_IMAGE_WITH_TAG_IDS = """
+WITH stored_object AS (
+        INSERT INTO objects (content_hash, storage_key)
+        SELECT $6::varchar, $3
+        WHERE $6::varchar IS NOT NULL
+        ON CONFLICT (content_hash) DO UPDATE SET content_hash = EXCLUDED.content_hash
+        RETURNING storage_key
+),
+image AS (
+        INSERT INTO images (id, name, storage_key, uploaded_by, tags, content_hash)
+        VALUES (
+                $1,
+                $2,
+                coalesce((SELECT storage_key FROM stored_object), $3),
+                $4,
+                $5::int[],
+                $6::varchar
+        )
+        RETURNING id, name, storage_key, created_at, uploaded_by
+),
+linked AS (
+        INSERT INTO tagged (tag, image, created_at)
+        SELECT tag_id, image.id, image.created_at
+        FROM unnest($5::int[]) AS tag_id, image
+)
+SELECT * FROM image
+"""
+
+SEARCH_IMAGES_ALL_TAGS = """
+WITH found AS (
+        SELECT id, name, storage_key, created_at, uploaded_by, tags AS tag_ids
+        FROM images
+        WHERE tags @> $1::int[]
+        AND created_at >= $3
+        AND (created_at, id) < ($4, $5)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $2
+)
+SELECT
+        found.id,
+        found.name,
+        found.storage_key,
+        found.created_at,
+        found.uploaded_by,
+        ARRAY(SELECT t FROM tags AS t WHERE t.id = ANY(found.tag_ids) ORDER BY t.id) AS tags
+FROM found
+ORDER BY created_at DESC, id DESC
+"""
+
+SEARCH_IMAGES_ANY_TAGS = """
+WITH found AS (
+        SELECT id, name, storage_key, created_at, uploaded_by, tags AS tag_ids
+        FROM images
+        WHERE tags && $1::int[]
+        AND created_at >= $3
+        AND (created_at, id) < ($4, $5)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $2
+)
+SELECT
+        found.id,
+        found.name,
+        found.storage_key,
+        found.created_at,
+        found.uploaded_by,
+        ARRAY(SELECT t FROM tags AS t WHERE t.id = ANY(found.tag_ids) ORDER BY t.id) AS tags
+FROM found
+ORDER BY created_at DESC, id DESC
+"""
+
+BACKFILL_IMAGE_TAGS = """
+WITH batch AS (
+        SELECT id, created_at
+        FROM images
+        WHERE id > $1
+        ORDER BY id
+        LIMIT $2
+),
+updated AS (
+        UPDATE images
+        SET tags = image_tags.tags
+        FROM (
+                SELECT tagged.image, array_agg(tagged.tag ORDER BY tagged.tag) AS tags
+                FROM batch
+                JOIN tagged
+                ON tagged.image = batch.id AND tagged.created_at = batch.created_at
+                GROUP BY tagged.image
+        ) AS image_tags
+        WHERE images.id = image_tags.image
+)
+SELECT
+        (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_id,
+        (SELECT count(*) FROM batch) AS size
+"""
+
+CREATE_TAGGED_PARTITIONS = """
+SELECT create_tagged_partitions($1, $2)
+"""
+
+CREATE_PARTITIONS_OF_MONTHS = """
+SELECT coalesce(sum(create_tagged_partition(month)), 0)::int
+FROM (
+        SELECT DISTINCT date_trunc('month', coalesce(created_at, now()) AT TIME ZONE 'UTC') AS month
+        FROM unnest($1::timestamptz[]) AS created_at
+) AS months
+"""
+
+FIND_OBJECT = """
+SELECT storage_key FROM objects WHERE content_hash = $1 AND refs > 0
+"""
+
+LOCK_ORPHANED_OBJECTS = """
+SELECT storage_key FROM objects
+WHERE refs = 0 AND orphaned_at < now() - $1::interval
+ORDER BY orphaned_at
+LIMIT $2
+FOR UPDATE SKIP LOCKED
+"""
+
+DELETE_OBJECTS = """
+DELETE FROM objects WHERE storage_key = ANY($1::varchar[])
 """
@@ -0,0 +1,69 @@
+from asyncio import Task, create_task, gather, sleep, wait_for
+from contextlib import suppress
+from random import choice
+from typing import List, Optional
+
+from asyncpg.pool import Pool
+from logzero import logger as log
+
+REPLICA_LAG = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE coalesce(
+        extract(epoch FROM now() - pg_last_xact_replay_timestamp())::float8,
+        'Infinity'::float8
+    )
+END
+"""
+
+
+class Replicas:
+    """Read-replica pools, replicas lagging too far behind the primary
+    (or unreachable) are ejected until they catch up again.
+    Replicas start ejected, the first lag check admits the reachable ones
+    """
+
+    def __init__(self, pools: List[Pool], max_lag: float = 5.0, check_interval: float = 2.0):
+        self.pools = pools
+        self.healthy: List[Pool] = []
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._checker: Optional[Task] = None
+
+    def pick(self) -> Optional[Pool]:
+        return choice(self.healthy) if self.healthy else None
+
+    async def _lag(self, pool: Pool) -> float:
+        try:
+            return await wait_for(pool.fetchval(REPLICA_LAG), self._check_interval)
+        except Exception as err:
+            log.error("Replica lag check failed: %s", err)
+            return float("inf")
+
+    async def check_lag(self):
+        lags = await gather(*[self._lag(pool) for pool in self.pools])
+        healthy = [pool for pool, lag in zip(self.pools, lags) if lag <= self._max_lag]
+
+        if len(healthy) != len(self.healthy):
+            log.warning("Healthy replicas: %s/%s", len(healthy), len(self.pools))
+
+        self.healthy = healthy
+
+    async def _run_checker(self):
+        while True:
+            await self.check_lag()
+            await sleep(self._check_interval)
+
+    def start(self):
+        if self.pools:
+            self._checker = create_task(self._run_checker())
+
+    async def close(self):
+        if self._checker:
+            self._checker.cancel()
+
+            with suppress(BaseException):
+                await self._checker
+
+        await gather(*[pool.close() for pool in self.pools])
@@ -0,0 +1,47 @@
+from bisect import bisect_left
+from typing import Any, Dict
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def count_rows(result: Any) -> int:
+    """Rows returned by fetch (list), fetchrow (record) or fetchval (value)"""
+    if isinstance(result, list):
+        return len(result)
+
+    return int(result is not None)
+
+
+class StatementStats:
+    """Call counters & latency histogram of a single prepared-statement"""
+
+    __slots__ = ("calls", "errors", "rows", "total_time", "max_time", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed: float, rows: int = 0, error: bool = False):
+        self.calls += 1
+        self.errors += int(error)
+        self.rows += rows
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        bounds = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_time": self.total_time,
+            "max_time": self.max_time,
+            "avg_time": self.total_time / self.calls if self.calls else 0,
+            "latency_histogram": dict(zip(bounds, self.buckets)),
+        }
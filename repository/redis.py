@@ -1,40 +1,259 @@
+from asyncio import Task, create_task, shield, sleep
+from contextlib import suppress
 from datetime import timedelta
+from time import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 from aioredis import Redis as RedisConnection
 from aioredis import from_url
+from aioredis.client import PubSub
+from logzero import logger as log
 
 from settings import Settings
 
 
 class Keys:
     INVALID_TOKEN = "invalid_tokens"
+    REVOKED_CHANNEL = "revoked_tokens"
+    TAG_VERSION = "tag_version"
+    TAG_BUMPED = "tag_bumped"
+    CACHED = "cached"
+    CACHE_LOCK = "cache_lock"
+
+    # Version bumped when images with unknown tags are added, ie by bulk imports
+    ANY_TAG = "*"
+
+
+# JSON null, a cached "not found"
+EMPTY = "null"
+
+
+def expire_at_from_ttl(ttl: int, now: float) -> float:
+    """Redis TTL of -1 means the key never expires"""
+    return now + ttl if ttl >= 0 else float("inf")
 
 
 class Redis:
-    def __init__(self, conn: RedisConnection):
+    """Once `start_revocation_sync` runs, revoked token ids are mirrored in-process:
+    rebuilt from Redis, updated through pub/sub, and fully reloaded every sync-interval
+    so that a missed message delays a revocation by one interval at most.
+    Until the mirror is in sync, token checks fall back to Redis
+    """
+
+    def __init__(
+        self,
+        conn: RedisConnection,
+        sync_interval: float = 30.0,
+        lock_timeout: float = 5.0,
+        bump_window: float = 5.0,
+    ):
         self.c = conn
+        self._revoked: Dict[str, float] = {}
+        self._synced = False
+        self._sync_interval = sync_interval
+        self._sync_task: Optional[Task] = None
+        self._lock_timeout = lock_timeout
+        self._bump_window_ms = max(int(bump_window * 1000), 1)
+        self._computing: Dict[str, Task] = {}
 
     @classmethod
     async def init(cls, st: Settings):
         client = from_url(st.REDIS_CONNECTION_STRING, decode_responses=True)
-        return cls(client)
+        return cls(
+            client,
+            sync_interval=st.REVOCATION_SYNC_INTERVAL,
+            lock_timeout=st.CACHE_LOCK_TIMEOUT,
+            bump_window=st.PG_REPLICA_MAX_LAG + st.PG_REPLICA_CHECK_INTERVAL,
+        )
 
     async def ping(self) -> bool:
         pong = await self.c.ping()
         return pong
 
-    async def invalidate_token(self, token: str, ttl: timedelta = None):
+    async def invalidate_token(self, token_id: str, ttl: timedelta = None):
+        """Revoke a token by its id (jti), not the whole token string"""
         pipe = self.c.pipeline(transaction=True)
+        expire_at = time() + ttl.total_seconds() if ttl else float("inf")
 
-        key = f"{Keys.INVALID_TOKEN}___{token}"
+        key = f"{Keys.INVALID_TOKEN}___{token_id}"
         pipe.set(key, "invalid")
 
         if ttl:
             pipe.expire(key, ttl.seconds)
 
+        pipe.publish(Keys.REVOKED_CHANNEL, f"{expire_at} {token_id}")
         await pipe.execute()
+        self._revoked[token_id] = expire_at
+
+    async def tag_versions(self, tags: List[str]) -> List[int]:
+        """Current version of each tag, followed by the version of any tag"""
+        keys = [f"{Keys.TAG_VERSION}___{t}" for t in [*tags, Keys.ANY_TAG]]
+        versions = await self.c.mget(keys)
+        return [int(v or 0) for v in versions]
+
+    async def bump_tag_versions(self, tags: List[str] = None):
+        """Outdate everything cached for these tags, or for all tags when none given.
+        Bumped tags are also flagged as such for the bump-window
+        """
+        pipe = self.c.pipeline(transaction=False)
+
+        for tag in [Keys.ANY_TAG] if tags is None else tags:
+            pipe.incr(f"{Keys.TAG_VERSION}___{tag}")
+            pipe.set(f"{Keys.TAG_BUMPED}___{tag}", 1, px=self._bump_window_ms)
+
+        await pipe.execute()
+
+    async def bumped_recently(self, tags: List[str]) -> bool:
+        """Whether any of these tags, or all tags, got bumped within the bump-window"""
+        keys = [f"{Keys.TAG_BUMPED}___{t}" for t in [*tags, Keys.ANY_TAG]]
+        return bool(await self.c.exists(*keys))
+
+    async def _wait_for_lock(self, key: str, lock: str) -> Tuple[Optional[str], bool]:
+        """Poll until the lock is ours or its holder has cached the value, at most lock-timeout.
+        Return the cached value if any, and whether the lock is ours
+        """
+        deadline = time() + self._lock_timeout
+        timeout_ms = int(self._lock_timeout * 1000)
+
+        while not await self.c.set(lock, "locked", nx=True, px=timeout_ms):
+            await sleep(0.05)
+            value = await self.c.get(key)
+
+            if value is not None or time() > deadline:
+                return value, False
+
+        return None, True
+
+    async def _cache(
+        self, key: str, compute: Callable[[], Awaitable[str]], ttl: int, empty_ttl: int
+    ) -> str:
+        value = await compute()
+        await self.c.set(key, value, ex=empty_ttl if value == EMPTY else ttl)
+        return value
+
+    async def _get_or_lock(self, key: str, lock: str) -> Tuple[Optional[str], bool]:
+        value = await self.c.get(key)
+
+        if value is not None:
+            return value, False
+
+        return await self._wait_for_lock(key, lock)
+
+    async def _compute(
+        self, key: str, compute: Callable[[], Awaitable[str]], ttl: int, empty_ttl: int
+    ) -> str:
+        """Once waiting for the lock timed out, the value is computed without it:
+        only a lock actually acquired gets released
+        """
+        lock = f"{Keys.CACHE_LOCK}___{key}"
+        value, locked = await self._get_or_lock(key, lock)
+
+        if value is not None:
+            return value
 
-    async def is_token_invalid(self, token) -> bool:
-        key = f"{Keys.INVALID_TOKEN}___{token}"
+        try:
+            return await self._cache(key, compute, ttl, empty_ttl)
+        finally:
+            if locked:
+                await self.c.delete(lock)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        ttl: int,
+        empty_ttl: int = None,
+    ) -> str:
+        """Cached value of the key, computed once when missing no matter how many callers:
+        concurrent callers in this process share one task, other processes wait on a lock.
+        An EMPTY value is cached for `empty_ttl` instead, if given
+        """
+        key = f"{Keys.CACHED}___{key}"
+        task = self._computing.get(key)
+
+        if not task:
+            computing = self._compute(key, compute, ttl, empty_ttl or ttl)
+            task = self._computing[key] = create_task(computing)
+            task.add_done_callback(lambda _: self._computing.pop(key, None))
+
+        return await shield(task)
+
+    async def is_token_invalid(self, token_id: str) -> bool:
+        if self._synced:
+            return self._revoked.get(token_id, 0) > time()
+
+        key = f"{Keys.INVALID_TOKEN}___{token_id}"
         value = await self.c.get(key)
         return bool(value)
+
+    async def load_revoked_tokens(self):
+        """Rebuild the in-process revoked tokens from Redis, dropping expired ones"""
+        pattern = f"{Keys.INVALID_TOKEN}___*"
+        keys = [k async for k in self.c.scan_iter(match=pattern, count=1000)]
+
+        pipe = self.c.pipeline(transaction=False)
+
+        for key in keys:
+            pipe.ttl(key)
+
+        ttls = await pipe.execute()
+        now, prefix = time(), len(pattern) - 1
+
+        self._revoked = {
+            key[prefix:]: expire_at_from_ttl(ttl, now)
+            for key, ttl in zip(keys, ttls)
+            if ttl != -2
+        }
+
+    def _on_revoked(self, message: str):
+        expire_at, token_id = message.split(" ", 1)
+        self._revoked[token_id] = float(expire_at)
+
+    async def _listen(self, pubsub: PubSub):
+        """Consume revocation messages for one sync-interval"""
+        deadline = time() + self._sync_interval
+
+        while time() < deadline:
+            msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+
+            if msg:
+                self._on_revoked(msg["data"])
+
+    async def _sync_revoked_tokens(self):
+        pubsub = self.c.pubsub()
+
+        try:
+            # Subscribe before loading, so no revocation falls in between
+            await pubsub.subscribe(Keys.REVOKED_CHANNEL)
+
+            while True:
+                await self.load_revoked_tokens()
+                self._synced = True
+                await self._listen(pubsub)
+        finally:
+            await pubsub.reset()
+
+    async def _retry_sync_revoked_tokens(self):
+        """Sync until the connection drops, then wait a bit before the next attempt"""
+        try:
+            await self._sync_revoked_tokens()
+        except Exception as err:
+            self._synced = False
+            log.error("Revoked tokens out of sync, retrying: %s", err)
+            await sleep(1)
+
+    async def _run_revocation_sync(self):
+        while True:
+            await self._retry_sync_revoked_tokens()
+
+    def start_revocation_sync(self):
+        self._sync_task = create_task(self._run_revocation_sync())
+
+    async def close(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+
+            with suppress(BaseException):
+                await self._sync_task
+
+        await self.c.close()
@@ -1,5 +1,5 @@
 from os import getenv
-from typing import Literal
+from typing import List, Literal, Optional
 
 from pydantic import BaseSettings
 
@@ -12,13 +12,47 @@ class Settings(BaseSettings):
     PG_PWD: str
     PG_DATABASE: str
     PG_PORT: int = 5678
+    PG_POOL_MIN_SIZE: int = 2
+    PG_POOL_MAX_SIZE: int = 10
+    PG_ACQUIRE_TIMEOUT: float = 5.0
+    PG_REPLICA_DSNS: List[str] = []
+    PG_REPLICA_MAX_LAG: float = 5.0
+    PG_REPLICA_CHECK_INTERVAL: float = 2.0
+    PG_READ_YOUR_WRITES_WINDOW: float = 10.0
+    PG_SLOW_QUERY_THRESHOLD: Optional[float] = None
+    PG_PARTITION_MONTHS_AHEAD: int = 3
+    TAG_CACHE_SIZE: int = 50000
     MONGO_CONNECTION_STRING: str
+    TRACKING_QUEUE_SIZE: int = 10000
+    TRACKING_BATCH_SIZE: int = 500
+    TRACKING_FLUSH_INTERVAL: float = 2.0
     REDIS_CONNECTION_STRING: str
+    REVOCATION_SYNC_INTERVAL: float = 30.0
+    CACHE_LOCK_TIMEOUT: float = 5.0
+    SEARCH_CACHE_TTL: int = 300
+    IMAGE_CACHE_SIZE: int = 10000
+    IMAGE_CACHE_TTL: int = 3600
+    IMAGE_CACHE_LOCAL_TTL: float = 60.0
+    IMAGE_MISS_TTL: int = 10
     STORAGE_HOST: str
     STORAGE_ACCESS_KEY: str
     STORAGE_SECRET_KEY: str
     STORAGE_BUCKET: str
+    STORAGE_REGION: str = "us-east-1"
+    STORAGE_MAX_WORKERS: int = 8
+    STORAGE_MAX_UPLOADS: int = 32
+    STORAGE_URL_EXPIRE_MINUTES: int = 20
+    STORAGE_URL_CACHE_SIZE: int = 10000
+    UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024
+    UPLOAD_MAX_FIELD_SIZE: int = 16 * 1024
+    UPLOAD_IDLE_TIMEOUT: float = 30.0
+    CONTENT_ADDRESSED_STORAGE: bool = False
+    OBJECT_GC_GRACE_HOURS: int = 24
     JWT_SECRET: str
+    JWT_CACHE_SIZE: int = 10000
+    PWD_HASH_ROUNDS: int = 30000
+    PWD_HASH_WORKERS: int = 4
+    PWD_HASH_QUEUE_SIZE: int = 64
     GOOGLE_APP_CLIENT_ID: str
     STAGE: Stage = "development"
     CORS_ORIGINS_ALLOWED: str = "*"
@@ -1,13 +1,25 @@
+import json
+from datetime import datetime
+from functools import partial
 from random import choice, sample
+from tempfile import TemporaryFile
 from time import time
+from timeit import timeit
+from uuid import uuid4
 
 import pytest
 import pytest_asyncio  # noqa
 from faker import Faker
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from logzero import logger as log  # noqa
 
 from libs import make_storage_key
+from libs.responses import MSGPACK, FastResponse, accepted_media_type
+from model.http import QueryImageResponse, SearchImagesResponse
+from model.postgres import Image, Tag, TaggedImage
 from repository.postgres import Postgres
+from repository.postgres.connect import to_tagged_image
 from settings import settings
 
 fake = Faker()
@@ -55,12 +67,130 @@ async def test_insert_many_images():
 
     log.info(tags)
 
-    for _ in range(100000):
+    manifest = TemporaryFile("w+")
+
+    for _ in range(1000000):
         name = fake.file_name(category="image")
-        storage_key = make_storage_key(name)
-        uploader = choice(users)
-        tag_choices = sample(tags, 5)
-        await pg.save_tagged_image(name, storage_key, uploader, tag_choices)
+        image = {
+            "name": name,
+            "storage_key": make_storage_key(name),
+            "tags": sample(tags, 5),
+        }
+        manifest.write(json.dumps(image) + "\n")
+
+    manifest.seek(0)
+    start = time()
+    imported, _ = await pg.import_manifest(manifest, choice(users), batch_size=50000)
+    log.info("Imported %s images in %.2fs", imported, time() - start)
+
+
+@pytest.mark.skip(reason="activate only after inserting test data")
+async def test_deep_pagination():
+    """Keyset pagination: a deep page should cost about the same as the first one"""
+    pg: Postgres = await Postgres.init(settings)
+    search_tags = await pg.c.fetch("SELECT name FROM tags LIMIT 3")
+    search_tags = [r["name"] for r in search_tags]
+
+    timings = []
+    images = []
+
+    for page in range(200):
+        last = images[-1].image if images else None
+        start = time()
+        images = await pg.search_image_by_tags(
+            search_tags,
+            50,
+            previous_id=last.id if last else None,
+            to_date=last.created_at if last else None,
+        )
+        timings.append(time() - start)
+
+        if not images:
+            break
+
+    log.info("Page 1 = %.4fs, page %s = %.4fs", timings[0], len(timings), timings[-1])
+    await pg.close()
+
+
+SIGNED_URL = "http://localhost:9000/images/some-key?X-Amz-Signature=abc"
+
+
+def fake_search_rows(count: int):
+    return [
+        {
+            "id": uuid4(),
+            "name": fake.file_name(category="image"),
+            "storage_key": make_storage_key("a.png"),
+            "created_at": datetime.now(),
+            "uploaded_by": 1,
+            "tags": [{"id": i, "name": fake.word()} for i in range(5)],
+        }
+        for _ in range(count)
+    ]
+
+
+def build_validated(rows: list):
+    for r in rows:
+        tags = [Tag(name=t["name"]) for t in r["tags"]]
+        image = TaggedImage(image=Image(**r), tags=tags)
+        QueryImageResponse(**image.image.dict(), tags=image.tag_names, url=SIGNED_URL)
+
+
+def build_constructed(rows: list):
+    for r in rows:
+        QueryImageResponse.from_tagged_image(to_tagged_image(r), SIGNED_URL)
+
+
+@pytest.mark.skip(reason="activate only when benchmarking")
+async def test_row_building_cost():
+    """Per-row cost of turning a 50-row search page into response models"""
+    rows = fake_search_rows(50)
+    runs = 200
+
+    for bench in (build_validated, build_constructed):
+        per_row = timeit(partial(bench, rows), number=runs) / (runs * len(rows))
+        log.info("%s: %.2fus per row", bench.__name__, per_row * 1e6)
+
+
+def fake_search_page(size: int) -> SearchImagesResponse:
+    data = [
+        QueryImageResponse(
+            id=uuid4(),
+            name=fake.file_name(category="image"),
+            created_at=datetime.now(),
+            uploaded_by=1,
+            url=SIGNED_URL,
+            tags=fake.words(nb=5),
+        )
+        for _ in range(size)
+    ]
+    return SearchImagesResponse(data=data, next="tags=a&cursor=b")
+
+
+def render_msgpack(content):
+    token = accepted_media_type.set(MSGPACK)
+    FastResponse(content)
+    accepted_media_type.reset(token)
+
+
+def render_encoded(render, content):
+    render(jsonable_encoder(content))
+
+
+@pytest.mark.skip(reason="activate only when benchmarking")
+async def test_serialization_cost():
+    """Rendering cost of a search page: stdlib json vs orjson vs msgpack.
+    Includes jsonable_encoder, that FastAPI runs on every response_model anyway
+    """
+    renderers = {"json": JSONResponse, "orjson": FastResponse, "msgpack": render_msgpack}
+    runs = 200
+
+    for size in (10, 50, 200):
+        content = fake_search_page(size)
+
+        for name, render in renderers.items():
+            cost = timeit(partial(render_encoded, render, content), number=runs) / runs
+            log.info("%s rows, %s: %.1fus per page", size, name, cost * 1e6)
 
 
 test_query = """
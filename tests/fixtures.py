@@ -5,7 +5,7 @@ import pytest
 import pytest_asyncio  # noqa
 import pytz
 from aioredis import Redis as RedisConnection
-from asyncpg import Connection
+from asyncpg.pool import Pool
 from fastapi.testclient import TestClient
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
@@ -32,7 +32,7 @@ async def setup():
     mc = await MetricCollector.init(settings)
     rd = await Redis.init(settings)
 
-    assert isinstance(pg.c, Connection)
+    assert isinstance(pg.c, Pool)
     assert isinstance(mc.c, AsyncIOMotorClient)
     assert isinstance(mc.db, AsyncIOMotorDatabase)
     assert isinstance(rd.c, RedisConnection)
@@ -81,10 +81,11 @@ async def setup():
     DELETE FROM tagged;
     DELETE FROM tags;
     DELETE FROM images;
+    DELETE FROM objects;
     DELETE FROM users;
     """
     )
-    await pg.c.close()
+    await pg.close()
 
     await rd.c.flushall()
 
@@ -96,7 +97,11 @@ class API:
     logout = "v1/auth/logout"
 
     upload_image = "v1/image"
+    bulk_import = "v1/image/bulk"
     find_one_image = "v1/image/find_one"
     find_many_images = "v1/image/find_many"
+    find_images_by_ids = "v1/image/find_by_ids"
 
     add_tag = "v1/tag"
+
+    metrics = "v1/metrics"
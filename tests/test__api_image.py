@@ -1,19 +1,30 @@
 """Testing authentication flow of App
 """
+import json
+from hashlib import sha256
 from random import sample
 from urllib.parse import parse_qs
-from uuid import UUID
+from uuid import UUID, uuid4
 
+import pytest
 from faker import Faker
 from logzero import logger as log
 
+import dependencies.upload as upload_dependencies
+from dependencies import image_cache
+from libs import make_storage_key
 from model.http import UploadImageResponse
+from repository import Postgres
+from settings import settings
 
 from .fixtures import API, pytestmark, setup  # noqa
 
 fake = Faker()
 Faker.seed(0)
 
+with open("tests/sample.jpeg", "rb") as sample_file:
+    SAMPLE_IMAGE = sample_file.read()
+
 
 async def test_image_upload(setup):  # noqa
     client, auth = setup("app", "auth")
@@ -40,6 +51,107 @@ async def test_image_upload(setup):  # noqa
     assert resp.tags == []
     assert isinstance(resp.id, UUID)
     assert resp.uploaded_by == auth.user_id
+    assert resp.sha256 == sha256(image_data).hexdigest()
+
+
+async def test_upload_checks_image_stream(setup):  # noqa
+    client, headers = setup("app", "headers")
+
+    def upload(name: str, data: bytes):
+        files = {"image": (name, data, "multipart/form-data")}
+        return client.post(API.upload_image, headers=headers, files=files, data={"tags": "a"})
+
+    # Names with many dots are fine, the type comes from the content
+    assert upload("my.holiday.photo.jpeg", SAMPLE_IMAGE).status_code == 200
+
+    # Not an image, whatever the file name says
+    assert upload("fake.jpeg", b"GET / HTTP/1.1\r\n" * 10).status_code == 400
+    assert upload("movie.mov", SAMPLE_IMAGE).status_code == 400
+
+    # Aborted as soon as the size cap is crossed
+    too_large = SAMPLE_IMAGE + bytes(settings.UPLOAD_MAX_SIZE)
+    assert upload("large.jpeg", too_large).status_code == 413
+
+    # One image per upload, small fields only
+    files = [("image", ("a.jpeg", SAMPLE_IMAGE)), ("image", ("b.jpeg", SAMPLE_IMAGE))]
+    assert client.post(API.upload_image, headers=headers, files=files).status_code == 400
+
+    files = {"image": ("a.jpeg", SAMPLE_IMAGE)}
+    data = {"tags": "a" * (settings.UPLOAD_MAX_FIELD_SIZE + 1)}
+    resp = client.post(API.upload_image, headers=headers, files=files, data=data)
+    assert resp.status_code == 413
+
+    # Unknown fields are skipped, within the same size cap
+    data = {"tags": "a", "foo": "b"}
+    resp = client.post(API.upload_image, headers=headers, files=files, data=data)
+    assert resp.status_code == 200
+
+    data = {"tags": "a", "foo": "b" * (settings.UPLOAD_MAX_FIELD_SIZE + 1)}
+    resp = client.post(API.upload_image, headers=headers, files=files, data=data)
+    assert resp.status_code == 413
+
+    # Anything but a whole multipart form is rejected
+    def post_raw(content_type: str, body: bytes):
+        raw_headers = {**headers, "Content-Type": content_type}
+        return client.post(API.upload_image, headers=raw_headers, data=body)
+
+    head = b'--XyZ\r\nContent-Disposition: form-data; name="image"; filename="a.jpeg"\r\n\r\n'
+    form = head + SAMPLE_IMAGE + b"\r\n--XyZ--\r\n"
+    assert post_raw("multipart/form-data; boundary=XyZ", form).status_code == 200
+    assert post_raw("multipart/form-data; boundary=XyZ", form[:-200]).status_code == 400
+    assert post_raw("multipart/form-data; boundary=XyZ", b"not a form").status_code == 400
+    assert post_raw("multipart/form-data", form).status_code == 400
+    assert post_raw("application/json", b'{"image": null}').status_code == 400
+
+    # The form is documented even though FastAPI doesn't parse it
+    openapi = client.get("/openapi.json").json()
+    body = openapi["paths"]["/v1/image"]["post"]["requestBody"]
+    assert "image" in body["content"]["multipart/form-data"]["schema"]["properties"]
+
+
+async def test_upload_content_addressed(setup, monkeypatch):  # noqa
+    client, headers, pg = setup("app", "headers", "pg")
+    monkeypatch.setattr(settings, "CONTENT_ADDRESSED_STORAGE", True)
+    content_hash = sha256(SAMPLE_IMAGE).hexdigest()
+
+    def upload(name: str, **data):
+        files = {"image": (name, SAMPLE_IMAGE, "multipart/form-data")}
+        return client.post(API.upload_image, headers=headers, files=files, data=data)
+
+    # Same content uploaded twice is stored once
+    ids = [upload(name).json()["id"] for name in ("a.jpeg", "b.jpeg")]
+    query = "SELECT storage_key FROM images WHERE id = $1"
+    keys = [await pg.c.fetchval(query, UUID(i)) for i in ids]
+    assert keys[0] == keys[1]
+    assert await pg.find_object(content_hash) == keys[0]
+
+    # A declared known hash skips storing, a wrong one is rejected
+    resp = upload("c.jpeg", sha256=content_hash)
+    assert resp.status_code == 200
+    assert resp.json()["sha256"] == content_hash
+    assert await pg.c.fetchval("SELECT refs FROM objects") == 3
+
+    wrong_hash = sha256(b"something else").hexdigest()
+    assert upload("d.jpeg", sha256=wrong_hash).status_code == 400
+
+
+async def test_upload_cleans_up_storage(setup, monkeypatch):  # noqa
+    client, headers, minio = setup("app", "headers", "minio")
+    key = make_storage_key("a.jpeg")
+    monkeypatch.setattr(upload_dependencies, "make_storage_key", lambda _: key)
+
+    async def failing_save(*args, **kwargs):
+        raise RuntimeError("save failed")
+
+    monkeypatch.setattr(Postgres, "save_tagged_image", failing_save)
+
+    # The image written is deleted when its save fails
+    files = {"image": ("a.jpeg", SAMPLE_IMAGE)}
+
+    with pytest.raises(RuntimeError):
+        client.post(API.upload_image, headers=headers, files=files)
+
+    assert await minio.stored_images([key]) == set()
 
 
 async def test_upload_multi_image(setup):  # noqa
@@ -48,7 +160,7 @@ async def test_upload_multi_image(setup):  # noqa
     image_name = "my_image.jpeg"
 
     files = {
-        "image": (image_name, bytearray("", encoding="utf-8"), "multipart/form-data")
+        "image": (image_name, SAMPLE_IMAGE, "multipart/form-data")
     }
 
     # Upload multi images of same name should succeed
@@ -68,7 +180,7 @@ async def test_upload_image_with_tags(setup):  # noqa
     image_name = "my_image.jpeg"
 
     files = {
-        "image": (image_name, bytearray("", encoding="utf-8"), "multipart/form-data"),
+        "image": (image_name, SAMPLE_IMAGE, "multipart/form-data"),
     }
 
     tags = fake.words(nb=10)
@@ -90,13 +202,13 @@ async def test_upload_image_with_tags(setup):  # noqa
 
 
 async def test_find_image_by_id(setup):  # noqa
-    client, auth, headers = setup("app", "auth", "headers")
+    client, headers, rd = setup("app", "headers", "rd")
 
     tags = fake.words(nb=5)
 
     def make_files():
         name = fake.file_name(category="image")
-        data = bytearray("", encoding="utf-8")
+        data = SAMPLE_IMAGE
         return {"image": (name, data, "multipart/form-data")}
 
     def upload():
@@ -126,6 +238,46 @@ async def test_find_image_by_id(setup):  # noqa
     tags = resp.json()["tags"]
     assert len(tags) == 4
 
+    # Served from the in-process cache the second time, same payload
+    hits = image_cache.hits
+    again = client.get(API.find_one_image, headers=headers, params={"id": image_ids[0]})
+    assert again.json()["tags"] == tags
+    assert image_cache.hits == hits + 1
+
+    # Unknown ids are cached as missing, briefly
+    unknown = uuid4()
+    resp = client.get(API.find_one_image, headers=headers, params={"id": unknown})
+    assert resp.status_code == 404
+    assert await rd.c.get(f"cached___image___{unknown}") == "null"
+    assert 0 < await rd.c.ttl(f"cached___image___{unknown}") <= settings.IMAGE_MISS_TTL
+
+
+async def test_find_images_by_ids(setup):  # noqa
+    client, headers = setup("app", "headers")
+
+    def upload(tags: str):
+        name = fake.file_name(category="image")
+        file = {"image": (name, SAMPLE_IMAGE, "multipart/form-data")}
+        resp = client.post(API.upload_image, headers=headers, files=file, data={"tags": tags})
+        return resp.json()["id"]
+
+    image_ids = [upload("one,two"), upload("three"), upload("four")]
+    unknown = str(uuid4())
+    ids = [image_ids[2], unknown, image_ids[0]]
+
+    resp = client.post(API.find_images_by_ids, headers=headers, json={"ids": ids})
+    assert resp.status_code == 200
+
+    data = resp.json()
+    assert [i["id"] for i in data["data"]] == [image_ids[2], image_ids[0]]
+    assert sorted(data["data"][1]["tags"]) == ["one", "two"]
+    assert all(i["url"] for i in data["data"])
+    assert data["missing"] == [unknown]
+
+    too_many = [str(uuid4()) for _ in range(501)]
+    resp = client.post(API.find_images_by_ids, headers=headers, json={"ids": too_many})
+    assert resp.status_code == 422
+
 
 async def test_search_image(setup):  # noqa
     client, auth, headers = setup("app", "auth", "headers")
@@ -134,7 +286,7 @@ async def test_search_image(setup):  # noqa
 
     def make_files():
         name = fake.file_name(category="image")
-        data = bytearray("", encoding="utf-8")
+        data = SAMPLE_IMAGE
         return {"image": (name, data, "multipart/form-data")}
 
     def upload():
@@ -191,3 +343,47 @@ async def test_search_image(setup):  # noqa
     images = resp["data"]
     assert len(images) == 5
     assert next_link == ""
+
+    # Cached search results are outdated by an upload with one of the tags
+    params = {"tags": ",".join(tags), "limit": 20}
+    first = client.get(API.find_many_images, headers=headers, params=params).json()
+    again = client.get(API.find_many_images, headers=headers, params=params).json()
+    assert [i["id"] for i in first["data"]] == [i["id"] for i in again["data"]]
+
+    new_id = upload()
+    found = client.get(API.find_many_images, headers=headers, params=params).json()
+    assert len(found["data"]) == 11
+    assert found["data"][0]["id"] == new_id
+
+
+async def test_bulk_import(setup):  # noqa
+    client, headers, minio = setup("app", "headers", "minio")
+
+    lines = [
+        {"name": f"{i}.png", "storage_key": f"key-{i}", "tags": ["bulk"]} for i in range(10)
+    ]
+
+    async def chunks():
+        yield SAMPLE_IMAGE
+
+    # Only images actually in storage are imported
+    for line in lines[:8]:
+        await minio.save_image(line["storage_key"], chunks(), "image/jpeg")
+
+    manifest = "\n".join(json.dumps(line) for line in lines)
+    files = {"manifest": ("manifest.jsonl", manifest, "application/x-ndjson")}
+
+    resp = client.post(API.bulk_import, headers=headers, files=files)
+    assert resp.status_code == 200
+    assert resp.json() == {"imported": 8, "total": 10}
+
+    found = client.get(
+        API.find_many_images,
+        headers=headers,
+        params={"tags": "bulk", "limit": 20},
+    )
+    assert len(found.json()["data"]) == 8
+
+    files = {"manifest": ("manifest.jsonl", "not-json", "application/x-ndjson")}
+    resp = client.post(API.bulk_import, headers=headers, files=files)
+    assert resp.status_code == 400
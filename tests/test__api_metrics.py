@@ -0,0 +1,39 @@
+"""Testing the metrics endpoint
+"""
+import msgpack
+
+from .fixtures import API, pytestmark, setup  # noqa
+
+
+async def test_metrics(setup):  # noqa
+    client, headers = setup("app", "headers")
+
+    response = client.get(API.metrics)
+    assert response.status_code == 401
+
+    response = client.get(API.metrics, headers=headers)
+    assert response.status_code == 200
+
+    data = response.json()
+    assert set(data["caches"]) == {"jwt_claims", "tags", "images", "presigned_urls"}
+    assert "hits" in data["caches"]["jwt_claims"]
+    assert "dropped" in data["tracking"]
+    assert isinstance(data["statements"], dict)
+    assert isinstance(data["slow_queries"], list)
+
+
+async def test_msgpack_negotiation(setup):  # noqa
+    client, headers = setup("app", "headers")
+
+    response = client.get(API.metrics, headers=headers)
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["vary"] == "Accept"
+
+    msgpack_headers = {**headers, "Accept": "application/msgpack"}
+    response = client.get(API.metrics, headers=msgpack_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert response.headers["vary"] == "Accept"
+
+    data = msgpack.unpackb(response.content)
+    assert set(data) == {"statements", "slow_queries", "caches", "tracking"}
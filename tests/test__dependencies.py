@@ -6,7 +6,7 @@ import pytest
 import pytest_asyncio  # noqa
 from fastapi import HTTPException
 
-from dependencies import create_auth_response, jwt_guard
+from dependencies import claims_cache, create_auth_response, jwt_guard
 from model.auth import AuthenticatedUser
 from model.http import AuthResponse
 from model.postgres import User
@@ -14,7 +14,7 @@ from model.postgres import User
 pytestmark = pytest.mark.asyncio
 
 
-def test_jwt_guard_and_auth_response():
+async def test_jwt_guard_and_auth_response():
     """JwtGuard shall handle user'token verification"""
     standard_user = User(
         id=1,
@@ -33,12 +33,25 @@ def test_jwt_guard_and_auth_response():
     assert auth_data.provider == "app"
     assert auth_data.user_id == standard_user.id
 
-    verified_user = jwt_guard(auth_data.access_token)
+    verified_user = await jwt_guard(auth_data.access_token)
     assert isinstance(verified_user, AuthenticatedUser)
     assert verified_user.user_id == auth_data.user_id
     assert verified_user.email == auth_data.email
     assert verified_user.provider == auth_data.provider
 
+    # Verified tokens are served from cache afterwards
+    hits = claims_cache.hits
+    assert await jwt_guard(auth_data.access_token) is verified_user
+    assert claims_cache.hits == hits + 1
+
+    # Tokens are revoked by their compact jti claim
+    assert verified_user.jti and len(verified_user.jti) < 20
+    assert verified_user.token_id == verified_user.jti
+
+    # Tokens issued without jti fall back to the whole token
+    legacy_user = verified_user.copy(update={"jti": None})
+    assert legacy_user.token_id == auth_data.access_token
+
     # AuthResponse can me created with AuthenticatedUser passed as param
     auth_data = create_auth_response(verified_user)
     assert isinstance(auth_data, AuthResponse)
@@ -51,7 +64,7 @@ def test_jwt_guard_and_auth_response():
     # Invalid token handling
     with pytest.raises(HTTPException) as excepinfo:
         token = "invalid"
-        jwt_guard(token)
+        await jwt_guard(token)
 
     unauthorized_exception = excepinfo.value
     assert unauthorized_exception.status_code == 401
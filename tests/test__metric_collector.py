@@ -1,5 +1,6 @@
 """Unit testing the custom Postgres module
 """
+from asyncio import sleep
 from datetime import datetime
 
 from logzero import logger as log
@@ -52,3 +53,36 @@ async def test_initialize(setup):  # noqa
     get_log = await mc.db[Collections.TRACKING_USERS].find_one({"_id": doc_id})
     assert get_log
     assert get_log["extra"] == metadata
+
+
+async def test_batched_tracking(setup):  # noqa
+    mc = setup("mc")
+    mc._queue_size, mc._batch_size, mc._flush_interval = 10, 4, 0.1
+    collection = mc.db[Collections.TRACKING_USERS]
+
+    user = AuthenticatedUser(
+        user_id=2,
+        email="me@vutr.io",
+        provider="app",
+        token="some-tokken",
+        exp=datetime.now(),
+    )
+
+    # Tracking only buffers data, nothing is written yet
+    for i in range(12):
+        mc.track_user(user, f"http://localhost:8000/image/{i}")
+
+    assert await collection.count_documents({}) == 0
+
+    # Events beyond the buffer size are dropped
+    assert mc.dropped == 2
+
+    # Background flusher writes full batches without being awaited by anyone
+    mc.start()
+    await sleep(0.5)
+    assert await collection.count_documents({}) == 10
+
+    # Closing flushes the remaining events
+    mc.track_user(user, "http://localhost:8000/image/last")
+    await mc.close()
+    assert await collection.count_documents({}) == 11
@@ -0,0 +1,82 @@
+"""Unit testing the custom Minio module
+"""
+from asyncio import (CancelledError, Event, create_task, gather,
+                     get_running_loop, wait_for)
+
+import pytest
+
+from libs import make_storage_key
+from repository.minio import ChunkPipe
+from settings import settings
+
+from .fixtures import pytestmark, setup  # noqa
+
+
+async def test_save_and_get_image(setup):  # noqa
+    minio = setup("minio")
+
+    with open("tests/sample.jpeg", "rb") as image:
+        data = image.read()
+
+    async def chunks():
+        for start in range(0, len(data), 1000):
+            end = start + 1000
+            yield data[start:end]
+
+    # Storage calls are awaitable and can run concurrently, data is fed chunk by chunk
+    keys = [make_storage_key("sample.jpeg") for _ in range(5)]
+    saved = await gather(*[minio.save_image(k, chunks(), "image/jpeg") for k in keys])
+    assert saved == keys
+
+    urls = minio.get_images(keys)
+
+    for key, url in zip(keys, urls):
+        assert url.startswith("http")
+        assert key in url
+
+    # Presigned urls are cached, signing again yields the very same url
+    assert minio.get_image(keys[0]) == urls[0]
+    assert minio.get_images(keys[::-1]) == urls[::-1]
+
+
+async def test_chunk_pipe_aborted():
+    loop = get_running_loop()
+    pipe = ChunkPipe(loop)
+
+    async def chunks():
+        yield b"some"
+        raise CancelledError
+
+    with pytest.raises(CancelledError):
+        await pipe.feed(chunks())
+
+    # The SDK aborts its multipart upload on an Exception only, not on a cancellation
+    with pytest.raises(IOError):
+        await loop.run_in_executor(None, pipe.read)
+
+
+async def test_chunk_pipe_idle():
+    loop = get_running_loop()
+    pipe = ChunkPipe(loop, idle_timeout=0.1)
+
+    # The client sends nothing: the reader gives up, the SDK aborts the upload
+    with pytest.raises(IOError):
+        await loop.run_in_executor(None, pipe.read)
+
+
+async def test_slow_uploads_dont_starve_storage(setup):  # noqa
+    minio = setup("minio")
+    resumed = Event()
+
+    async def stalled_chunks():
+        yield b"some"
+        await resumed.wait()
+        yield b"more"
+
+    # As many stalled uploads as storage workers, short calls still go through
+    keys = [make_storage_key("slow.jpeg") for _ in range(settings.STORAGE_MAX_WORKERS)]
+    uploads = [create_task(minio.save_image(k, stalled_chunks(), "image/jpeg")) for k in keys]
+    assert await wait_for(minio.stored_images(keys), 5) == set()
+
+    resumed.set()
+    assert await gather(*uploads) == keys
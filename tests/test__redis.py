@@ -1,8 +1,12 @@
 """Testing authentication flow of App
 """
+import asyncio
 from datetime import timedelta
 from time import sleep
 
+from repository.redis import Redis
+from settings import settings
+
 from .fixtures import API, pytestmark, setup  # noqa
 
 
@@ -30,3 +34,82 @@ async def test_redis(setup):  # noqa
     check_again = await rd.is_token_invalid(token)
 
     assert check_again is False
+
+
+async def test_revocation_sync(setup):  # noqa
+    rd = setup("rd")
+
+    # Revoked before the node starts: loaded on startup
+    await rd.invalidate_token("early-token", ttl=timedelta(seconds=60))
+
+    node = await Redis.init(settings)
+    node.start_revocation_sync()
+    await asyncio.sleep(0.5)
+
+    assert node._synced is True
+    assert await node.is_token_invalid("early-token") is True
+    assert await node.is_token_invalid("valid-token") is False
+
+    # Revoked on another node: delivered through pub/sub
+    await rd.invalidate_token("late-token", ttl=timedelta(seconds=1))
+    await asyncio.sleep(0.5)
+    assert "late-token" in node._revoked
+    assert await node.is_token_invalid("late-token") is True
+
+    # Expiry is honored locally as well
+    await asyncio.sleep(1)
+    assert await node.is_token_invalid("late-token") is False
+
+    await node.close()
+
+
+async def test_get_or_compute(setup):  # noqa
+    rd = setup("rd")
+    other_node = await Redis.init(settings)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.2)
+        return "computed"
+
+    # Concurrent misses, in this process & in another one, compute only once
+    results = await asyncio.gather(
+        *[rd.get_or_compute("key", compute, ttl=10) for _ in range(5)],
+        *[other_node.get_or_compute("key", compute, ttl=10) for _ in range(5)],
+    )
+    assert results == ["computed"] * 10
+    assert calls == 1
+
+    assert await rd.get_or_compute("key", compute, ttl=10) == "computed"
+    assert calls == 1
+
+    # Past the lock timeout, the value is computed without the lock, which is left alone
+    lock = "cache_lock___cached___stuck"
+    await rd.c.set(lock, "held-elsewhere", ex=10)
+    rd._lock_timeout = 0.1
+    assert await rd.get_or_compute("stuck", compute, ttl=10) == "computed"
+    assert await rd.c.get(lock) == "held-elsewhere"
+
+    await other_node.close()
+
+
+async def test_tag_versions(setup):  # noqa
+    rd = setup("rd")
+
+    assert await rd.tag_versions(["cat", "dog"]) == [0, 0, 0]
+
+    await rd.bump_tag_versions(["cat"])
+    assert await rd.tag_versions(["cat", "dog"]) == [1, 0, 0]
+
+    # Without tags, every tag is outdated
+    await rd.bump_tag_versions()
+    assert await rd.tag_versions(["cat", "dog"]) == [1, 0, 1]
+
+    # Bumps are flagged for a short while, so that searches skip lagging replicas
+    assert await rd.bumped_recently(["dog"]) is True
+    await rd.c.flushall()
+    await rd.bump_tag_versions(["cat"])
+    assert await rd.bumped_recently(["cat"]) is True
+    assert await rd.bumped_recently(["dog"]) is False
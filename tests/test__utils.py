@@ -1,13 +1,17 @@
 """Unit testing utility functions
 """
+from datetime import datetime, timezone
+from time import time
 from uuid import uuid4
 
 import pytest  # noqa
 import pytest_asyncio  # noqa
 from pydantic import BaseModel
 
-from libs import (convert_string_to_uuid, initialize_model, trying,
-                  validate_image_file, validate_tag)
+from libs import (Crypt, LRUCache, convert_string_to_uuid, decode_cursor,
+                  encode_cursor, initialize_model, trying, validate_image_file,
+                  validate_tag)
+from settings import settings
 
 
 def test_trying_decorator():
@@ -32,6 +36,17 @@ def test_trying_decorator():
 
     assert will_raise() is False
 
+    class Sample:
+        value = 2
+
+        @trying()
+        def double(self):
+            """Methods get their instance bound"""
+            return self.value * 2
+
+    assert Sample().double() == 4
+    assert Sample.double.__doc__ == "Methods get their instance bound"
+
 
 def test_initializing_model():
     """Make Pydantic model initialization fault-tolerant"""
@@ -56,6 +71,7 @@ def test_validate_image():
         "asd-sadfsad-sdf.PNG",
         "asd-sadfsad-sdf.png",
         "ASD-sadfsad-sdf.jpeg",
+        "holiday.2021.jpg",
     ]
 
     for n in valid_names:
@@ -66,6 +82,8 @@ def test_validate_image():
         "adddfs.mov",
         "sadfasdmov",
         "sadfasdjpg",
+        ".png",
+        "archive.png.zip",
     ]
 
     for n in invalid_names:
@@ -112,3 +130,53 @@ def test_validate_tag():
 
     for v in invalids:
         assert not validate_tag(v)
+
+
+def test_lru_cache():
+    cache = LRUCache(2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.get("a") == 1
+
+    # Least recently used key is evicted first
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+    # Expired entries are never returned
+    cache.set("d", 4, expire_at=time() - 1)
+    assert cache.get("d") is None
+
+    assert cache.stats() == {"size": 1, "hits": 3, "misses": 2}
+
+
+@pytest.mark.asyncio
+async def test_crypt():
+    crypt = Crypt(settings)
+    hashed = await crypt.hash("my-password")
+
+    assert await crypt.verify("my-password", hashed)
+    assert not await crypt.verify("wrong-password", hashed)
+
+    # Up-to-date hash does not need rehashing
+    valid, new_hash = await crypt.verify_and_update("my-password", hashed)
+    assert valid and new_hash is None
+
+    # Changing the cost params rehashes transparently on verification
+    rounds = settings.PWD_HASH_ROUNDS + 1000
+    stronger = Crypt(settings.copy(update={"PWD_HASH_ROUNDS": rounds}))
+    valid, new_hash = await stronger.verify_and_update("my-password", hashed)
+    assert valid and new_hash and new_hash != hashed
+    assert f"${rounds}$" in new_hash
+
+
+def test_pagination_cursor():
+    created_at, image_id = datetime.now(timezone.utc), uuid4()
+    cursor = encode_cursor(created_at, image_id)
+
+    assert str(image_id) not in cursor
+    assert decode_cursor(cursor) == (created_at, image_id)
+    assert decode_cursor("not-a-cursor") is None